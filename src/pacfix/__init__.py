@@ -1,47 +1,228 @@
-from typing import NamedTuple, List, Dict, Set, Tuple
+import math
+import time
+import random
+from typing import NamedTuple, List, Dict, Set, Tuple, Callable, Hashable, Iterator, Optional
 
-from .invariant import InvariantManager, LiveVariable
-from .synthesis import Synthesizer
-from .utils import calculate_pac, filter_duplicate
+from .invariant import Invariant, InvariantManager, LiveVariable
+from .synthesis import Synthesizer, CONST_MODES, get_const_pools
+from .canonical import Canonicalizer, TRUE_KEY, get_binary_vars
+from .engines import ENGINES, Engine, get_engine, cross_check
+from .checkpoint import CheckpointError, start_checkpoint, validate_checkpointed
+from .utils import calculate_pac, calculate_pac_agnostic, calculate_pac_samples, filter_duplicate, get_space_size
 from .debug import enable_debug, disable_debug, print_debug, print_warning
 
-__all__ = ["__version__", "Result", "learn"]
+__all__ = ["__version__", "Metadata", "Result", "Problem", "prepare", "learn"]
 __version__ = "0.0.4"
 
 
+class Metadata(NamedTuple):
+    # Everything known before validation starts
+    size_orig: int
+    size_dedup: int
+    samples_neg: int
+    samples_pos: int
+    samples_neg_init: int
+    samples_pos_init: int
+    pac_epsilon: float
+    # None when it does not apply, i.e. with tolerated violations
+    pac_epsilon_no_uniq: Optional[float]
+    # Constant pools used, and the deduplicated size and epsilon the fixed
+    # default pools would have given
+    const_mode: str
+    size_dedup_default: int
+    pac_epsilon_default: float
+    # Violated valuations tolerated per candidate, 0 for exact validation
+    max_violations: int
+
+
 class Result(NamedTuple):
     size_orig: int
+    size_dedup: int
     size_final: int
     samples_neg: int
     samples_pos: int
     pac_epsilon: float
-    pac_epsilon_no_uniq: float
+    pac_epsilon_no_uniq: Optional[float]
     # TODO: move InvariantManager.dump out
     # and pass around just List[Invariant]
     inv_mgr: InvariantManager
+    # Seconds spent validating, None if the survivors were not validated here
+    validation_time: Optional[float]
 
 
-def learn(live_vars: Dict[int, LiveVariable],
-          neg_vals_init: List[Dict[int, int]],
-          pos_vals_init: List[Dict[int, int]],
-          pac_delta: float):
-    synthesizer = Synthesizer(live_vars)
-    hypothesis_space = synthesizer.synthesize()
-    size_orig = len(hypothesis_space)
+class Problem(NamedTuple):
+    # Deduplicated hypothesis space and valuations, ready for validation
+    synthesizer: Synthesizer
+    hypothesis_space: List[Invariant]
+    binary_vars: Set[int]
+    neg_vals: List[Dict[int, int]]
+    pos_vals: List[Dict[int, int]]
+    metadata: Metadata
 
+
+def prepare(live_vars: Dict[int, LiveVariable],
+            neg_vals_init: List[Dict[int, int]],
+            pos_vals_init: List[Dict[int, int]],
+            pac_delta: float,
+            combine_depth: int = 1,
+            const_mode: str = "default",
+            const_cap: int = 32,
+            max_violations: int = 0,
+            max_violation_rate: Optional[float] = None) -> Problem:
+    if const_mode not in CONST_MODES:
+        raise ValueError(f"Unknown constant mode {const_mode}: choose from {', '.join(CONST_MODES)}")
     neg_vals = filter_duplicate(neg_vals_init)
     pos_vals = filter_duplicate(pos_vals_init)
-    refined_space = synthesizer.validate(hypothesis_space, neg_vals, pos_vals)
+    const_pools = None
+    if const_mode == "data":
+        const_pools = get_const_pools(live_vars, neg_vals, pos_vals, const_cap)
+    synthesizer = Synthesizer(live_vars, const_pools)
+    hypothesis_space = synthesizer.synthesize()
+    size_orig = get_space_size(len(hypothesis_space), combine_depth)
+
+    # Drop semantically equivalent candidates before validation
+    binary_vars = get_binary_vars(live_vars, neg_vals + pos_vals)
+    canonicalizer = Canonicalizer(live_vars, binary_vars)
+    hypothesis_space = canonicalizer.dedup(hypothesis_space)
+    size_dedup = get_space_size(len(hypothesis_space), combine_depth)
+    size_dedup_default = size_dedup
+    if const_mode != "default":
+        default_space = canonicalizer.dedup(Synthesizer(live_vars).synthesize())
+        size_dedup_default = get_space_size(len(default_space), combine_depth)
 
     samples = len(neg_vals) + len(pos_vals)
-    pac_epsilon = calculate_pac(samples, size_orig, pac_delta)
-    samples_no_uniq = len(neg_vals_init) + len(pos_vals_init)
-    pac_epsilon_no_uniq = calculate_pac(samples_no_uniq, size_orig, pac_delta)
+    if max_violation_rate is not None:
+        max_violations = max(max_violations, math.floor(max_violation_rate * samples))
+    if max_violations == 0:
+        pac_epsilon = calculate_pac(samples, size_dedup, pac_delta)
+        samples_no_uniq = len(neg_vals_init) + len(pos_vals_init)
+        pac_epsilon_no_uniq = calculate_pac(samples_no_uniq, size_dedup, pac_delta)
+        pac_epsilon_default = calculate_pac(samples, size_dedup_default, pac_delta)
+    else:
+        # Survivors may be wrong on up to max_violations valuations, so the
+        # zero-error bound does not hold. Violations are counted on the
+        # deduplicated valuations, so there is no bound for the original ones.
+        pac_epsilon = calculate_pac_agnostic(samples, size_dedup, pac_delta, max_violations)
+        pac_epsilon_no_uniq = None
+        pac_epsilon_default = calculate_pac_agnostic(samples, size_dedup_default, pac_delta, max_violations)
+    metadata = Metadata(size_orig, size_dedup, len(neg_vals), len(pos_vals),
+        len(neg_vals_init), len(pos_vals_init), pac_epsilon, pac_epsilon_no_uniq,
+        const_mode, size_dedup_default, pac_epsilon_default, max_violations)
+    return Problem(synthesizer, hypothesis_space, binary_vars, neg_vals, pos_vals, metadata)
+
+
+def check_engine(evaluation_engine: Engine, problem: Problem, samples: int):
+    mismatches = cross_check(evaluation_engine, problem.hypothesis_space,
+        problem.neg_vals, problem.pos_vals, samples, max_violations=problem.metadata.max_violations)
+    live_vars = problem.synthesizer.live_vars
+    for mismatch in mismatches:
+        where = "in validation" if mismatch.vals is None else f"at {mismatch.vals}"
+        print_warning(f"Engine {evaluation_engine.name} disagrees with reference on {mismatch.inv.to_str(live_vars)}"
+            f" {where}: expected {mismatch.expected}, got {mismatch.actual}")
+    if len(mismatches) == 0:
+        print_debug(f"Engine {evaluation_engine.name} agrees with reference")
+
+
+def iter_validate_sampled(evaluation_engine: Engine, hypothesis_space: List[Invariant],
+                          neg_vals: List[Dict[int, int]], pos_vals: List[Dict[int, int]],
+                          sample_size: int, seed: int = 0, max_violations: int = 0) -> Iterator[Invariant]:
+    # Two phases: most refuted candidates already fail on a random subset of
+    # the positive valuations, so only the survivors see the remaining ones.
+    # A candidate survives both phases iff it survives full validation.
+    if sample_size >= len(pos_vals):
+        yield from evaluation_engine.iter_validate(hypothesis_space, neg_vals, pos_vals, max_violations)
+        return
+    sampled = set(random.Random(seed).sample(range(len(pos_vals)), sample_size))
+    pos_sampled = [vals for i, vals in enumerate(pos_vals) if i in sampled]
+    pos_rest = [vals for i, vals in enumerate(pos_vals) if i not in sampled]
+    survivors = list(evaluation_engine.iter_validate(hypothesis_space, neg_vals, pos_sampled, max_violations))
+    print_debug(f"Phase one kept {len(survivors)} of {len(hypothesis_space)} candidates on {sample_size} pos")
+    # Violations on the subset never exceed those on the full set, so each
+    # survivor continues with the budget it has left
+    yield from evaluation_engine.iter_validate_continue(survivors, [], pos_rest, max_violations,
+        [inv.violations for inv in survivors])
+
+
+def learn(live_vars: Dict[int, LiveVariable],
+          neg_vals_init: List[Dict[int, int]],
+          pos_vals_init: List[Dict[int, int]],
+          pac_delta: float,
+          combine_depth: int = 1,
+          on_metadata: Optional[Callable[[Metadata], None]] = None,
+          on_invariant: Optional[Callable[[Invariant], None]] = None,
+          engine: str = "reference",
+          cross_check_samples: int = 0,
+          const_mode: str = "default",
+          const_cap: int = 32,
+          sample_epsilon: Optional[float] = None,
+          max_violations: int = 0,
+          max_violation_rate: Optional[float] = None,
+          checkpoint_path: Optional[str] = None,
+          checkpoint_interval: float = 5.0,
+          resume: bool = False):
+    if checkpoint_path is not None and sample_epsilon is not None:
+        raise CheckpointError("Sampled validation cannot be checkpointed")
+    problem = prepare(live_vars, neg_vals_init, pos_vals_init, pac_delta,
+        combine_depth=combine_depth, const_mode=const_mode, const_cap=const_cap,
+        max_violations=max_violations, max_violation_rate=max_violation_rate)
+    synthesizer, hypothesis_space, _, neg_vals, pos_vals, metadata = problem
+    evaluation_engine = get_engine(engine, synthesizer)
+    checkpoint = None
+    if checkpoint_path is not None:
+        checkpoint = start_checkpoint(checkpoint_path, resume, hypothesis_space, neg_vals, pos_vals,
+            metadata.max_violations)
+    if on_metadata is not None:
+        on_metadata(metadata)
+    if cross_check_samples > 0:
+        check_engine(evaluation_engine, problem, cross_check_samples)
+
+    refined_space = list()
+
+    def found(inv: Invariant):
+        refined_space.append(inv)
+        if on_invariant is not None:
+            on_invariant(inv)
+
+    start = time.perf_counter()
+    if checkpoint is not None:
+        survivors = validate_checkpointed(evaluation_engine, hypothesis_space, neg_vals, pos_vals,
+            checkpoint, checkpoint_path, checkpoint_interval)
+    elif sample_epsilon is None:
+        survivors = evaluation_engine.iter_validate(hypothesis_space, neg_vals, pos_vals,
+            metadata.max_violations)
+    else:
+        # Size phase one so that it alone would give sample_epsilon
+        sample_size = calculate_pac_samples(metadata.size_dedup, pac_delta, sample_epsilon)
+        survivors = iter_validate_sampled(evaluation_engine, hypothesis_space, neg_vals, pos_vals,
+            sample_size, max_violations=metadata.max_violations)
+    for inv in survivors:
+        found(inv)
+    if combine_depth > 1:
+        # Skip combinations that always hold or are equivalent to an atom or
+        # an earlier combination
+        canonicalizer = Canonicalizer(live_vars, problem.binary_vars)
+        atom_keys: Dict[int, Hashable] = dict()
+        seen = {canonicalizer.canonical_key(inv) for inv in refined_space}
+        seen.add(TRUE_KEY)
+        for inv in synthesizer.combine(hypothesis_space, neg_vals, pos_vals, combine_depth,
+                                       evaluation_engine.truth_vectors, evaluation_engine.iter_validate):
+            key = canonicalizer.combination_key(inv, atom_keys)
+            if key in seen:
+                print_debug(f"Duplicate combination: {inv.to_str(live_vars)}")
+                continue
+            seen.add(key)
+            found(inv)
+    validation_time = time.perf_counter() - start
+    print_debug(f"Validated {len(hypothesis_space)} candidates in {validation_time:.3f}s")
+    return make_result(live_vars, metadata, refined_space, validation_time)
+
 
+def make_result(live_vars: Dict[int, LiveVariable], metadata: Metadata, refined_space: List[Invariant],
+                validation_time: Optional[float] = None) -> Result:
     inv_manager = InvariantManager(live_vars)
     inv_manager.reduce()
     for inv in refined_space:
         inv_manager.add_invariant(inv)
-    return Result(size_orig, len(refined_space),
-        len(neg_vals), len(pos_vals),
-        pac_epsilon, pac_epsilon_no_uniq, inv_manager)
+    return Result(metadata.size_orig, metadata.size_dedup, len(refined_space),
+        metadata.samples_neg, metadata.samples_pos,
+        metadata.pac_epsilon, metadata.pac_epsilon_no_uniq, inv_manager, validation_time)
@@ -1,68 +1,105 @@
 import os
 import sys
 import argparse
+import tarfile
+import zipfile
 from contextlib import closing
 from functools import partial
 
-from . import __version__, Result, learn, utils, enable_debug
+from . import __version__, CheckpointError, Result, learn, make_result, utils, shard, enable_debug, print_warning, ENGINES
+from .synthesis import CONST_MODES
+from .writers import WRITERS
 
 
-def run(args: argparse.Namespace):
-    input_dir = args.input_dir
+def load_run(args: argparse.Namespace):
     with closing(args.live_vars):
         live_vars = utils.get_live_vars(args.live_vars)
-    vals_raw_neg = utils.get_valuations(os.path.join(args.input_dir, "neg"))
-    vals_raw_pos = utils.get_valuations(os.path.join(args.input_dir, "pos"))
+    vals_raw_neg, vals_raw_pos = utils.get_input_valuations(args.input_dir)
     vals_neg, vals_pos = utils.parse_valuation(vals_raw_neg, vals_raw_pos)
-    result = learn(live_vars, vals_neg, vals_pos, args.pac_delta)
-
-    output = args.output
-    int_vars = sum(v.var_type == utils.VarType.INT for v in live_vars.values())
-    output.write(f"[metadata] [live-variables] [total {len(live_vars)}] [int {int_vars}]\n")
-    output.write("[metadata] [hypothesis-space]"
-        f" [original {result.size_orig}] [final {result.size_final}]\n")
-    output.write("[metadata] [valuation]"
-        f" [neg {result.samples_neg}] [pos {result.samples_pos}]"
-        f" [uniq {result.samples_neg + result.samples_pos}]"
-        f" [init-neg {len(vals_neg)}] [init-pos {len(vals_pos)}]"
-        f" [non-uniq {len(vals_neg) + len(vals_pos)}]\n")
-    output.write(f"[metadata] [pac] [delta {args.pac_delta}]"
-        f" [eps {result.pac_epsilon}]\n")
-    output.write(f"[metadata] [pac-no-uniq] [delta {args.pac_delta}]"
-        f" [eps {result.pac_epsilon_no_uniq}]\n")
-    output.write("[final] --------------\n")
-    result.inv_mgr.dump(output, args.output_smt)
+    return live_vars, vals_neg, vals_pos
 
 
-def run_uni(args: argparse.Namespace):
+def load_uni(args: argparse.Namespace):
     with closing(args.live_vars):
         live_vars = utils.get_live_vars(args.live_vars)
     if args.lv_file is not None:
         with closing(args.lv_file):
             used_lvs = utils.get_lv_file(args.lv_file)
         live_vars = {k: v for k, v in live_vars.items() if v.name in used_lvs}
-    vals_raw_neg = utils.get_valuations(os.path.join(args.input_dir, "neg"))
-    vals_raw_pos = utils.get_valuations(os.path.join(args.input_dir, "pos"))
+    vals_raw_neg, vals_raw_pos = utils.get_input_valuations(args.input_dir)
     vals_neg, vals_pos = utils.parse_valuations_uni([],
         vals_raw_neg + vals_raw_pos)
-    result = learn(live_vars, vals_neg, vals_pos, args.pac_delta)
-
-    output = args.output
-    int_vars = sum(v.var_type == utils.VarType.INT for v in live_vars.values())
-    output.write(f"[metadata] [live-variables] [total {len(live_vars)}] [int {int_vars}]\n")
-    output.write("[metadata] [hypothesis-space]"
-        f" [original {result.size_orig}] [final {result.size_final}]\n")
-    output.write("[metadata] [valuation]"
-        f" [neg {result.samples_neg}] [pos {result.samples_pos}]"
-        f" [uniq {result.samples_neg + result.samples_pos}]"
-        f" [init-neg {len(vals_neg)}] [init-pos {len(vals_pos)}]"
-        f" [non-uniq {len(vals_neg) + len(vals_pos)}]\n")
-    output.write(f"[metadata] [pac] [delta {args.pac_delta}]"
-        f" [eps {result.pac_epsilon}]\n")
-    output.write(f"[metadata] [pac-no-uniq] [delta {args.pac_delta}]"
-        f" [eps {result.pac_epsilon_no_uniq}]\n")
-    output.write("[final] --------------\n")
-    result.inv_mgr.dump(output, None)
+    return live_vars, vals_neg, vals_pos
+
+
+def learn_or_exit(args: argparse.Namespace, live_vars, vals_neg, vals_pos, writer) -> Result:
+    try:
+        return learn(live_vars, vals_neg, vals_pos, args.pac_delta,
+            combine_depth=args.combine_depth,
+            on_metadata=writer.write_metadata,
+            on_invariant=writer.write_invariant,
+            engine=args.engine,
+            cross_check_samples=args.cross_check,
+            const_mode=args.consts,
+            const_cap=args.const_cap,
+            sample_epsilon=args.sample_eps,
+            max_violations=args.max_violations,
+            max_violation_rate=args.max_violation_rate,
+            checkpoint_path=args.checkpoint,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=args.resume)
+    except CheckpointError as e:
+        print_warning(str(e))
+        sys.exit(1)
+
+
+def run(args: argparse.Namespace):
+    live_vars, vals_neg, vals_pos = load_run(args)
+    writer = WRITERS[args.format](args.output, live_vars, args.pac_delta,
+        args.output_smt, args.inline_smt)
+    result = learn_or_exit(args, live_vars, vals_neg, vals_pos, writer)
+    writer.write_result(result)
+
+
+def run_uni(args: argparse.Namespace):
+    live_vars, vals_neg, vals_pos = load_uni(args)
+    writer = WRITERS[args.format](args.output, live_vars, args.pac_delta,
+        None, args.inline_smt)
+    result = learn_or_exit(args, live_vars, vals_neg, vals_pos, writer)
+    writer.write_result(result)
+
+
+def run_shard(args: argparse.Namespace):
+    if args.index >= args.of:
+        print_warning(f"--index {args.index} must be smaller than --of {args.of}")
+        sys.exit(1)
+    live_vars, vals_neg, vals_pos = load_uni(args) if args.uni else load_run(args)
+    try:
+        partial_result = shard.learn_shard(live_vars, vals_neg, vals_pos, args.pac_delta,
+            args.index, args.of, args.split, args.engine, args.cross_check,
+            args.consts, args.const_cap)
+    except ValueError as e:
+        print_warning(str(e))
+        sys.exit(1)
+    shard.dump_shard(partial_result, args.output)
+
+
+def run_merge(args: argparse.Namespace):
+    shards = list()
+    for shard_file in args.shards:
+        with closing(shard_file):
+            shards.append(shard.load_shard(shard_file))
+    try:
+        live_vars, metadata, refined_space = shard.merge_shards(shards)
+    except ValueError as e:
+        print_warning(str(e))
+        sys.exit(1)
+    writer = WRITERS[args.format](args.output, live_vars, shards[0].pac_delta,
+        args.output_smt, args.inline_smt)
+    writer.write_metadata(metadata)
+    for inv in refined_space:
+        writer.write_invariant(inv)
+    writer.write_result(make_result(live_vars, metadata, refined_space))
 
 
 def directory(path: str, read: bool) -> str:
@@ -76,34 +113,147 @@ def directory(path: str, read: bool) -> str:
     return path
 
 
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not an integer")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive integer")
+    return number
+
+
+def non_negative_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not an integer")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a non-negative integer")
+    return number
+
+
+def rate(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+    if not 0 <= number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not in [0, 1)")
+    return number
+
+
+def positive_float(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a number")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
+def input_path(path: str) -> str:
+    if os.path.isdir(path):
+        return path
+    if not os.path.isfile(path):
+        raise argparse.ArgumentTypeError(f"{path} is not a directory or an archive")
+    if not (tarfile.is_tarfile(path) or zipfile.is_zipfile(path)):
+        raise argparse.ArgumentTypeError(f"{path} is not a tar or zip archive")
+    return path
+
+
 def main():
     arg_parser = argparse.ArgumentParser(prog="pacfix")
     arg_parser.add_argument("-v", "--version", action="version",
                             version=f"%(prog)s {__version__}")
     arg_subparsers = arg_parser.add_subparsers(dest="mode", required=True)
+    arg_parser_common = argparse.ArgumentParser(add_help=False)
+    arg_parser_common.add_argument("-o", "--output", metavar="FILE",
+        help="Output file", type=argparse.FileType("w"), default=sys.stdout)
+    arg_parser_common.add_argument("-d", "--debug", action="store_true",
+                                   help="Enable debug log")
     arg_parser_base = argparse.ArgumentParser(add_help=False)
     arg_parser_base.add_argument("-i", "--input-dir", metavar="DIR",
-        help="Input directory",
-        type=partial(directory, read=True), required=True)
+        help="Input directory or .tar(.gz|.xz)/.zip archive",
+        type=input_path, required=True)
     arg_parser_base.add_argument("-l", "--live-vars", metavar="FILE",
         help="Live variables", type=argparse.FileType("r"), required=True)
     arg_parser_base.add_argument("-D", "--pac-delta", metavar="NUMBER",
         help="delta value for pac learning", type=float, default=0.01)
-    arg_parser_base.add_argument("-o", "--output", metavar="FILE",
-        help="Output file", type=argparse.FileType("w"), default=sys.stdout)
-    arg_parser_base.add_argument("-d", "--debug", action="store_true",
-                                 help="Enable debug log")
+    arg_parser_base.add_argument("-e", "--engine", choices=list(ENGINES),
+        help="Evaluation engine used for validation", default="reference")
+    arg_parser_base.add_argument("--cross-check", metavar="NUMBER",
+        help="Compare the engine with the reference one on NUMBER random valuations",
+        type=non_negative_int, default=0)
+    arg_parser_base.add_argument("--consts", choices=CONST_MODES,
+        help="Constant pools: fixed ranges, or mined from the valuations",
+        default="default")
+    arg_parser_base.add_argument("--const-cap", metavar="NUMBER",
+        help="Maximum number of mined constants per variable (with --consts data)",
+        type=positive_int, default=32)
+    arg_parser_format = argparse.ArgumentParser(add_help=False)
+    arg_parser_format.add_argument("-F", "--format", choices=list(WRITERS),
+        help="Output format", default="text")
+    arg_parser_format.add_argument("--inline-smt", action="store_true",
+        help="Include SMT-LIB expressions in ndjson records")
     arg_parser_run = arg_subparsers.add_parser("run",
-        parents=[arg_parser_base])
+        parents=[arg_parser_base, arg_parser_common, arg_parser_format])
     arg_parser_run.add_argument("-s", "--output-smt", metavar="DIR",
         help="Output directory for smt files",
         type=partial(directory, read=False))
     arg_parser_uni = arg_subparsers.add_parser("uni",
-        parents=[arg_parser_base])
+        parents=[arg_parser_base, arg_parser_common, arg_parser_format])
     arg_parser_uni.add_argument("-f", "--lv-file", metavar="FILE",
         help="Live variables file those are actually used",
         type=argparse.FileType("r"))
+    for arg_parser_learn in [arg_parser_run, arg_parser_uni]:
+        arg_parser_learn.add_argument("-c", "--combine-depth", metavar="NUMBER",
+            help="Maximum number of atoms combined by && or ||",
+            type=positive_int, default=1)
+        arg_group_phase = arg_parser_learn.add_mutually_exclusive_group()
+        arg_group_phase.add_argument("--sample-eps", metavar="NUMBER",
+            help="Validate first on a random subset of the positive valuations sized for this epsilon,"
+                 " then confirm the survivors on the rest",
+            type=positive_float)
+        arg_group_phase.add_argument("--checkpoint", metavar="FILE",
+            help="Validate the valuations in chunks and save the progress to FILE")
+        arg_parser_learn.add_argument("--checkpoint-interval", metavar="SECONDS",
+            help="Minimum time between two checkpoint writes", type=positive_float, default=5.0)
+        arg_parser_learn.add_argument("--resume", action="store_true",
+            help="Continue from the progress saved in the --checkpoint file")
+        arg_group_tolerance = arg_parser_learn.add_mutually_exclusive_group()
+        arg_group_tolerance.add_argument("--max-violations", metavar="NUMBER",
+            help="Keep candidates violating at most NUMBER valuations",
+            type=non_negative_int, default=0)
+        arg_group_tolerance.add_argument("--max-violation-rate", metavar="RATE",
+            help="Keep candidates violating at most this fraction of the valuations",
+            type=rate)
+    arg_parser_shard = arg_subparsers.add_parser("shard",
+        parents=[arg_parser_base, arg_parser_common],
+        help="Validate one slice of the work and write a partial result")
+    arg_parser_shard.add_argument("--index", metavar="NUMBER",
+        help="Index of this shard, from 0", type=non_negative_int, required=True)
+    arg_parser_shard.add_argument("--of", metavar="NUMBER",
+        help="Total number of shards", type=positive_int, required=True)
+    arg_parser_shard.add_argument("--split", choices=shard.SPLITS,
+        help="Split the hypothesis space or the valuations", default="space")
+    arg_parser_shard.add_argument("--uni", action="store_true",
+        help="Read uni-klee valuations, as in uni mode")
+    arg_parser_shard.add_argument("-f", "--lv-file", metavar="FILE",
+        help="Live variables file those are actually used (with --uni)",
+        type=argparse.FileType("r"))
+    arg_parser_merge = arg_subparsers.add_parser("merge",
+        parents=[arg_parser_common, arg_parser_format],
+        help="Merge partial results written by shard")
+    arg_parser_merge.add_argument("shards", metavar="FILE", nargs="+",
+        help="Partial result files", type=argparse.FileType("r"))
+    arg_parser_merge.add_argument("-s", "--output-smt", metavar="DIR",
+        help="Output directory for smt files",
+        type=partial(directory, read=False))
     args = arg_parser.parse_args()
+    if args.mode in ["run", "uni"] and args.resume and args.checkpoint is None:
+        arg_parser.error("--resume requires --checkpoint")
     if args.debug:
         enable_debug()
     if args.mode == "run":
@@ -112,6 +262,12 @@ def main():
     elif args.mode == "uni":
         with closing(args.output):
             run_uni(args)
+    elif args.mode == "shard":
+        with closing(args.output):
+            run_shard(args)
+    elif args.mode == "merge":
+        with closing(args.output):
+            run_merge(args)
 
 
 if __name__ == "__main__":
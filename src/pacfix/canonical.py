@@ -0,0 +1,269 @@
+from typing import List, Dict, Set, Tuple, Optional, Hashable
+import itertools
+import math
+
+from .invariant import Invariant, InvariantType, LiveVariable, VarType
+from .debug import print_debug
+
+# Canonical keys are plain tuples, so equivalent candidates hash together.
+#   ("TRUE",) / ("FALSE",)              constant predicates
+#   ("GE", coeffs, k)                   sum(coeffs) + k >= 0
+#   ("EQ", coeffs, k) / ("NE", ...)     sum(coeffs) + k == 0 / != 0
+#   ("TABLE", var_ids, outcomes)        truth table over binary variables
+# where coeffs is a sorted tuple of (atom, coefficient) pairs.
+TRUE_KEY = ("TRUE",)
+FALSE_KEY = ("FALSE",)
+
+COMPARISONS = [InvariantType.EQ, InvariantType.NE, InvariantType.GT,
+               InvariantType.GE, InvariantType.LT, InvariantType.LE]
+
+# Truth tables are only built for predicates over at most this many binary variables
+MAX_TABLE_VARS = 4
+
+Linear = Tuple[Dict[Hashable, int], int]
+
+
+class Canonicalizer():
+    live_vars: Dict[int, LiveVariable]
+    binary_vars: Set[int]
+
+    def __init__(self, live_vars: Dict[int, LiveVariable], binary_vars: Optional[Set[int]] = None):
+        self.live_vars = live_vars
+        # Variables known to only take the values 0 and 1
+        self.binary_vars = binary_vars if binary_vars is not None else set()
+
+    def linearize(self, inv: Invariant) -> Linear:
+        # Rewrite an integer term as (coefficients of atoms, constant)
+        inv_type = inv.inv_type
+        if inv_type == InvariantType.VAR:
+            return {("VAR", inv.data): 1}, 0
+        elif inv_type == InvariantType.CONST:
+            return {}, inv.data
+        elif inv_type in [InvariantType.ADD, InvariantType.SUB]:
+            sign = 1 if inv_type == InvariantType.ADD else -1
+            left_coeffs, left_const = self.linearize(inv.left)
+            right_coeffs, right_const = self.linearize(inv.right)
+            coeffs = dict(left_coeffs)
+            for atom, coeff in right_coeffs.items():
+                coeffs[atom] = coeffs.get(atom, 0) + sign * coeff
+            return {a: c for a, c in coeffs.items() if c != 0}, left_const + sign * right_const
+        elif inv_type == InvariantType.MUL:
+            left = self.linearize(inv.left)
+            right = self.linearize(inv.right)
+            if len(left[0]) == 0:
+                left, right = right, left
+            if len(right[0]) == 0:
+                factor = right[1]
+                return {a: c * factor for a, c in left[0].items() if c * factor != 0}, left[1] * factor
+            return {("MUL",) + tuple(sorted([self.term_key(left), self.term_key(right)])): 1}, 0
+        elif inv_type == InvariantType.DIV:
+            left = self.linearize(inv.left)
+            right = self.linearize(inv.right)
+            if len(left[0]) == 0 and len(right[0]) == 0 and right[1] != 0:
+                return {}, left[1] // right[1]
+            return {("DIV", self.term_key(left), self.term_key(right)): 1}, 0
+        return {("OPAQUE", inv.key()): 1}, 0
+
+    def term_key(self, linear: Linear) -> Hashable:
+        coeffs, const = linear
+        return (tuple(sorted(coeffs.items())), const)
+
+    def comparison_key(self, inv_type: InvariantType, linear: Linear) -> Hashable:
+        # linear is (left - right); bring everything to "e >= 0", "e == 0" or "e != 0"
+        coeffs, const = linear
+        if inv_type == InvariantType.GT:
+            inv_type, const = InvariantType.GE, const - 1
+        elif inv_type == InvariantType.LE:
+            inv_type, coeffs, const = InvariantType.GE, {a: -c for a, c in coeffs.items()}, -const
+        elif inv_type == InvariantType.LT:
+            inv_type, coeffs, const = InvariantType.GE, {a: -c for a, c in coeffs.items()}, -const - 1
+        if len(coeffs) == 0:
+            if inv_type == InvariantType.GE:
+                holds = const >= 0
+            elif inv_type == InvariantType.EQ:
+                holds = const == 0
+            else:
+                holds = const != 0
+            return TRUE_KEY if holds else FALSE_KEY
+        items = sorted(coeffs.items())
+        divisor = 0
+        for _, c in items:
+            divisor = math.gcd(divisor, c)
+        if inv_type == InvariantType.GE:
+            # sum(a * x) >= -k  <=>  sum(a / g * x) >= ceil(-k / g)
+            return ("GE", tuple((a, c // divisor) for a, c in items), const // divisor)
+        if const % divisor != 0:
+            return FALSE_KEY if inv_type == InvariantType.EQ else TRUE_KEY
+        if items[0][1] < 0:
+            divisor = -divisor
+        return (inv_type.name, tuple((a, c // divisor) for a, c in items), const // divisor)
+
+    def negate_key(self, key: Hashable) -> Hashable:
+        if key == TRUE_KEY:
+            return FALSE_KEY
+        if key == FALSE_KEY:
+            return TRUE_KEY
+        if key[0] == "GE":
+            # !(e >= 0)  <=>  -e - 1 >= 0
+            return ("GE", tuple((a, -c) for a, c in key[1]), -key[2] - 1)
+        if key[0] == "EQ":
+            return ("NE",) + key[1:]
+        if key[0] == "NE":
+            return ("EQ",) + key[1:]
+        if key[0] == "TABLE":
+            return ("TABLE", key[1], tuple(not o for o in key[2]))
+        if key[0] == "NOT":
+            return key[1]
+        return ("NOT", key)
+
+    def connective_key(self, inv_type: InvariantType, children: List[Hashable]) -> Hashable:
+        absorbing, neutral = (FALSE_KEY, TRUE_KEY) if inv_type == InvariantType.AND else (TRUE_KEY, FALSE_KEY)
+        operands = set()
+        for child in children:
+            if child[0] == inv_type.name:
+                operands.update(child[1])
+            else:
+                operands.add(child)
+        operands = self.merge_bounds(inv_type, operands)
+        if absorbing in operands:
+            return absorbing
+        operands.discard(neutral)
+        if len(operands) == 0:
+            return neutral
+        if len(operands) == 1:
+            return operands.pop()
+        return (inv_type.name, tuple(sorted(operands, key=repr)))
+
+    def merge_bounds(self, inv_type: InvariantType, operands: Set[Hashable]) -> Set[Hashable]:
+        # Bounds on the same linear term e combine into one interval:
+        # (e >= 1) || (e <= -1) is e != 0 and (e >= 0) && (e <= 0) is e == 0
+        terms = [key[1] if key[1][0][1] > 0 else tuple((a, -c) for a, c in key[1])
+                 for key in operands if key[0] == "GE"]
+        if len(set(terms)) == len(terms):
+            return operands
+        lower: Dict[tuple, List[int]] = dict()
+        upper: Dict[tuple, List[int]] = dict()
+        rest = set()
+        for key in operands:
+            if key[0] != "GE":
+                rest.add(key)
+            elif key[1][0][1] > 0:
+                # e + k >= 0  <=>  e >= -k
+                lower.setdefault(key[1], list()).append(-key[2])
+            else:
+                # -e + k >= 0  <=>  e <= k
+                upper.setdefault(tuple((a, -c) for a, c in key[1]), list()).append(key[2])
+        for coeffs in set(lower) | set(upper):
+            negated = tuple((a, -c) for a, c in coeffs)
+            # A disjunction keeps the weakest bounds, a conjunction the strongest
+            if inv_type == InvariantType.OR:
+                low = min(lower[coeffs]) if coeffs in lower else None
+                high = max(upper[coeffs]) if coeffs in upper else None
+            else:
+                low = max(lower[coeffs]) if coeffs in lower else None
+                high = min(upper[coeffs]) if coeffs in upper else None
+            if low is not None and high is not None:
+                if inv_type == InvariantType.OR and low <= high + 1:
+                    rest.add(TRUE_KEY)
+                    continue
+                if inv_type == InvariantType.OR and low == high + 2:
+                    rest.add(("NE", coeffs, -(high + 1)))
+                    continue
+                if inv_type == InvariantType.AND and low > high:
+                    rest.add(FALSE_KEY)
+                    continue
+                if inv_type == InvariantType.AND and low == high:
+                    rest.add(("EQ", coeffs, -low))
+                    continue
+            if low is not None:
+                rest.add(("GE", coeffs, -low))
+            if high is not None:
+                rest.add(("GE", negated, high))
+        return rest
+
+    def structural_key(self, inv: Invariant) -> Hashable:
+        inv_type = inv.inv_type
+        if inv_type in COMPARISONS:
+            left = self.linearize(inv.left)
+            right = self.linearize(inv.right)
+            coeffs = dict(left[0])
+            for atom, coeff in right[0].items():
+                coeffs[atom] = coeffs.get(atom, 0) - coeff
+            coeffs = {a: c for a, c in coeffs.items() if c != 0}
+            return self.comparison_key(inv_type, (coeffs, left[1] - right[1]))
+        elif inv_type == InvariantType.NOT:
+            return self.negate_key(self.canonical_key(inv.left))
+        elif inv_type in [InvariantType.AND, InvariantType.OR]:
+            return self.connective_key(inv_type, [self.canonical_key(inv.left), self.canonical_key(inv.right)])
+        elif inv_type == InvariantType.XOR:
+            return ("XOR",) + tuple(sorted([self.canonical_key(inv.left), self.canonical_key(inv.right)], key=repr))
+        return ("TERM", self.term_key(self.linearize(inv)))
+
+    def combination_key(self, inv: Invariant, atom_keys: Dict[int, Hashable]) -> Hashable:
+        # Key of a combination of atoms, reusing the keys of atoms seen before
+        if inv.inv_type in [InvariantType.AND, InvariantType.OR]:
+            return self.connective_key(inv.inv_type, [self.combination_key(inv.left, atom_keys),
+                                                      self.combination_key(inv.right, atom_keys)])
+        if id(inv) not in atom_keys:
+            atom_keys[id(inv)] = self.canonical_key(inv)
+        return atom_keys[id(inv)]
+
+    def table_key(self, key: Hashable) -> Hashable:
+        # Over binary variables a linear predicate is fully described by its truth table
+        if key[0] not in ["GE", "EQ", "NE"]:
+            return key
+        var_ids = list()
+        for atom, _ in key[1]:
+            if atom[0] != "VAR" or atom[1] not in self.binary_vars:
+                return key
+            var_ids.append(atom[1])
+        if len(var_ids) > MAX_TABLE_VARS:
+            return key
+        coeffs = [c for _, c in key[1]]
+        outcomes = list()
+        for values in itertools.product([0, 1], repeat=len(var_ids)):
+            total = sum(c * v for c, v in zip(coeffs, values)) + key[2]
+            if key[0] == "GE":
+                outcomes.append(total >= 0)
+            elif key[0] == "EQ":
+                outcomes.append(total == 0)
+            else:
+                outcomes.append(total != 0)
+        # Drop variables that do not affect the outcome
+        i = 0
+        while i < len(var_ids):
+            stride = 1 << (len(var_ids) - 1 - i)
+            if all(outcomes[j] == outcomes[j + stride] for j in range(len(outcomes)) if not j & stride):
+                outcomes = [outcomes[j] for j in range(len(outcomes)) if not j & stride]
+                del var_ids[i]
+            else:
+                i += 1
+        if len(var_ids) == 0:
+            return TRUE_KEY if outcomes[0] else FALSE_KEY
+        return ("TABLE", tuple(var_ids), tuple(outcomes))
+
+    def canonical_key(self, inv: Invariant) -> Hashable:
+        return self.table_key(self.structural_key(inv))
+
+    def dedup(self, hypothesis_space: List[Invariant]) -> List[Invariant]:
+        # Keep the first candidate of every equivalence class, in order
+        seen = set()
+        result = list()
+        for inv in hypothesis_space:
+            key = self.canonical_key(inv)
+            if key in seen:
+                print_debug(f"Duplicate: {inv}")
+                continue
+            seen.add(key)
+            result.append(inv)
+        return result
+
+
+def get_binary_vars(live_vars: Dict[int, LiveVariable], valuations: List[Dict[int, int]]) -> Set[int]:
+    # Bool variables whose observed values are all 0 or 1
+    binary_vars = {v.id for v in live_vars.values() if v.var_type == VarType.BOOL}
+    for vals in valuations:
+        for id in list(binary_vars):
+            if vals.get(id, 0) not in (0, 1):
+                binary_vars.discard(id)
+    return binary_vars
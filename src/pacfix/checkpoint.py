@@ -0,0 +1,120 @@
+from typing import List, Dict, NamedTuple
+import json
+import os
+import time
+
+from .invariant import Invariant
+from .engines import Engine
+from .utils import get_fingerprint, get_valuation_digest
+from .debug import print_debug, print_warning
+
+
+class CheckpointError(Exception):
+    # The checkpoint cannot be used for this run
+    pass
+
+
+class Checkpoint(NamedTuple):
+    # Progress of a validation that goes through the valuations in chunks
+    fingerprint: str
+    # Digest of the deduplicated valuations, so a resumed run sees the same
+    # valuations in the same order
+    valuation_digest: str
+    max_violations: int
+    # Valuations consumed so far
+    neg_offset: int
+    pos_offset: int
+    # Bit i is set iff hypothesis_space[i] is still alive
+    survivors: int
+    # Violations of the alive candidates, by position, when non-zero
+    violations: Dict[int, int]
+
+
+def dump_checkpoint(checkpoint: Checkpoint, path: str):
+    # Write to a temporary file first, so that an interrupted write never
+    # replaces the previous checkpoint with a truncated one
+    record = checkpoint._asdict()
+    record["survivors"] = format(checkpoint.survivors, "x")
+    record["violations"] = sorted(checkpoint.violations.items())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(record, f)
+        f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Checkpoint:
+    with open(path, "r") as f:
+        record = json.load(f)
+    record["survivors"] = int(record["survivors"], 16)
+    record["violations"] = {position: count for position, count in record["violations"]}
+    return Checkpoint(**record)
+
+
+def start_checkpoint(path: str, resume: bool, hypothesis_space: List[Invariant],
+                     neg_vals: List[Dict[int, int]], pos_vals: List[Dict[int, int]],
+                     max_violations: int) -> Checkpoint:
+    # Load the checkpoint to resume from, or start from scratch
+    fingerprint = get_fingerprint(hypothesis_space)
+    valuation_digest = get_valuation_digest(neg_vals, pos_vals)
+    if resume:
+        if os.path.exists(path):
+            checkpoint = load_checkpoint(path)
+            if checkpoint.fingerprint != fingerprint:
+                raise CheckpointError(f"Checkpoint {path} was written for a different hypothesis space")
+            if checkpoint.valuation_digest != valuation_digest:
+                raise CheckpointError(f"Checkpoint {path} was written for different valuations")
+            if checkpoint.max_violations != max_violations:
+                raise CheckpointError(f"Checkpoint {path} was written with --max-violations {checkpoint.max_violations}")
+            print_debug(f"Resume from {path}: {checkpoint.neg_offset} neg, {checkpoint.pos_offset} pos consumed")
+            return checkpoint
+        print_warning(f"No checkpoint at {path}, starting from scratch")
+    return Checkpoint(fingerprint, valuation_digest, max_violations, 0, 0,
+        (1 << len(hypothesis_space)) - 1, dict())
+
+
+def validate_checkpointed(evaluation_engine: Engine, hypothesis_space: List[Invariant],
+                          neg_vals: List[Dict[int, int]], pos_vals: List[Dict[int, int]],
+                          checkpoint: Checkpoint, path: str, interval: float,
+                          chunk_size: int = 1024) -> List[Invariant]:
+    # Validate every alive candidate on one chunk of valuations at a time, and
+    # write the progress to path at most every interval seconds
+    max_violations = checkpoint.max_violations
+    neg_offset, pos_offset = checkpoint.neg_offset, checkpoint.pos_offset
+    alive = [i for i in range(len(hypothesis_space)) if checkpoint.survivors >> i & 1]
+    violations = dict(checkpoint.violations)
+    last_write = time.monotonic()
+    while neg_offset < len(neg_vals) or pos_offset < len(pos_vals):
+        if neg_offset < len(neg_vals):
+            neg_chunk, pos_chunk = neg_vals[neg_offset:neg_offset + chunk_size], []
+        else:
+            neg_chunk, pos_chunk = [], pos_vals[pos_offset:pos_offset + chunk_size]
+        # Each candidate continues with the budget it has left
+        invs = [hypothesis_space[i] for i in alive]
+        kept = set(id(inv) for inv in evaluation_engine.iter_validate_continue(invs, neg_chunk, pos_chunk,
+            max_violations, [violations.get(i, 0) for i in alive]))
+        alive = [i for i in alive if id(hypothesis_space[i]) in kept]
+        violations = {i: hypothesis_space[i].violations for i in alive if hypothesis_space[i].violations > 0}
+        neg_offset += len(neg_chunk)
+        pos_offset += len(pos_chunk)
+        if time.monotonic() - last_write >= interval:
+            dump_checkpoint(make_checkpoint(checkpoint, neg_offset, pos_offset, alive, violations), path)
+            last_write = time.monotonic()
+    dump_checkpoint(make_checkpoint(checkpoint, neg_offset, pos_offset, alive, violations), path)
+    refined_space = list()
+    for i in alive:
+        inv = hypothesis_space[i]
+        inv.violations = violations.get(i, 0)
+        refined_space.append(inv)
+    return refined_space
+
+
+def make_checkpoint(checkpoint: Checkpoint, neg_offset: int, pos_offset: int,
+                    alive: List[int], violations: Dict[int, int]) -> Checkpoint:
+    survivors = 0
+    for i in alive:
+        survivors |= 1 << i
+    return checkpoint._replace(neg_offset=neg_offset, pos_offset=pos_offset,
+        survivors=survivors, violations=violations)
@@ -0,0 +1,418 @@
+from typing import List, Dict, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple, Type, Union
+import abc
+from collections import Counter
+from itertools import compress
+import operator
+import random
+
+from .invariant import Invariant, InvariantType, VariableCollector
+from .synthesis import Synthesizer, pack_bits
+from .debug import print_debug
+
+Evaluator = Callable[[Dict[int, int]], Union[bool, int]]
+
+
+class Engine(abc.ABC):
+    # Evaluates invariants on valuations; subclasses must agree exactly
+    # with the reference Synthesizer.evaluate
+    name: str = ""
+    synthesizer: Synthesizer
+
+    def __init__(self, synthesizer: Synthesizer):
+        self.synthesizer = synthesizer
+
+    @abc.abstractmethod
+    def evaluator(self, inv: Invariant) -> Evaluator:
+        pass
+
+    def truth_vector(self, inv: Invariant, vals_list: List[Dict[int, int]]) -> int:
+        # Bit i is set iff the invariant holds on vals_list[i]
+        evaluate = self.evaluator(inv)
+        return pack_bits([evaluate(vals) for vals in vals_list])
+
+    def truth_vectors(self, invs: List[Invariant], vals_list: List[Dict[int, int]]) -> List[int]:
+        return [self.truth_vector(inv, vals_list) for inv in invs]
+
+    def iter_validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                      max_violations: int = 0) -> Iterator[Invariant]:
+        for inv in hypothesis_space:
+            evaluate = self.evaluator(inv)
+            violations = 0
+            # negative validation: invariant should be false
+            for vals in neg_vals:
+                if evaluate(vals):
+                    violations += 1
+                    if violations > max_violations:
+                        break
+            if violations > max_violations:
+                continue
+            # positive validation: invariant should be true
+            for vals in pos_vals:
+                if not evaluate(vals):
+                    violations += 1
+                    if violations > max_violations:
+                        break
+            if violations <= max_violations:
+                inv.violations = violations
+                yield inv
+
+    def iter_validate_continue(self, invs: List[Invariant], neg_vals, pos_vals, max_violations: int,
+                               spent: List[int], validate: Optional[Callable[..., Iterable[Invariant]]] = None
+                               ) -> Iterator[Invariant]:
+        # Validate on more valuations when spent[i] violations of invs[i] are
+        # already counted: each candidate continues with the budget it has
+        # left, and survivors report their total in the original order
+        validate = validate or self.iter_validate
+        groups: Dict[int, List[Invariant]] = dict()
+        for inv, count in zip(invs, spent):
+            groups.setdefault(count, list()).append(inv)
+        if len(groups) == 1:
+            # Nothing to reorder, so survivors can be streamed
+            [(count, group)] = groups.items()
+            for inv in validate(group, neg_vals, pos_vals, max_violations - count):
+                inv.violations += count
+                yield inv
+            return
+        validated = set()
+        for count, group in groups.items():
+            for inv in validate(group, neg_vals, pos_vals, max_violations - count):
+                inv.violations += count
+                validated.add(id(inv))
+        yield from (inv for inv in invs if id(inv) in validated)
+
+
+ENGINES: Dict[str, Type[Engine]] = dict()
+
+
+def register_engine(cls: Type[Engine]) -> Type[Engine]:
+    ENGINES[cls.name] = cls
+    return cls
+
+
+@register_engine
+class ReferenceEngine(Engine):
+    name = "reference"
+
+    def evaluator(self, inv: Invariant) -> Evaluator:
+        return lambda vals: self.synthesizer.evaluate(inv, vals)
+
+    def truth_vector(self, inv: Invariant, vals_list: List[Dict[int, int]]) -> int:
+        return self.synthesizer.truth_vector(inv, vals_list)
+
+    def iter_validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                      max_violations: int = 0) -> Iterator[Invariant]:
+        return self.synthesizer.iter_validate(hypothesis_space, neg_vals, pos_vals, max_violations)
+
+
+COMPILED_OPERATORS = {
+    InvariantType.EQ: "==", InvariantType.NE: "!=", InvariantType.GT: ">", InvariantType.GE: ">=",
+    InvariantType.LT: "<", InvariantType.LE: "<=", InvariantType.ADD: "+", InvariantType.SUB: "-",
+    InvariantType.MUL: "*", InvariantType.DIV: "//",
+}
+
+
+@register_engine
+class CompiledEngine(Engine):
+    # Compiles each invariant to a Python lambda, avoiding the recursive
+    # interpretation of the reference engine. Python ints keep the same
+    # unbounded arithmetic and floor division.
+    name = "compiled"
+
+    def to_source(self, inv: Invariant) -> str:
+        inv_type = inv.inv_type
+        if inv_type == InvariantType.VAR:
+            return f"v[{inv.data}]"
+        elif inv_type == InvariantType.CONST:
+            return f"({inv.data})"
+        elif inv_type in COMPILED_OPERATORS:
+            return f"({self.to_source(inv.left)} {COMPILED_OPERATORS[inv_type]} {self.to_source(inv.right)})"
+        elif inv_type == InvariantType.AND:
+            return f"(bool({self.to_source(inv.left)}) and bool({self.to_source(inv.right)}))"
+        elif inv_type == InvariantType.OR:
+            return f"(bool({self.to_source(inv.left)}) or bool({self.to_source(inv.right)}))"
+        elif inv_type == InvariantType.NOT:
+            return f"(not {self.to_source(inv.left)})"
+        elif inv_type == InvariantType.XOR:
+            return f"(bool({self.to_source(inv.left)}) != bool({self.to_source(inv.right)}))"
+        raise ValueError(f"Cannot compile {inv}")
+
+    def evaluator(self, inv: Invariant) -> Evaluator:
+        return eval(compile(f"lambda v: {self.to_source(inv)}", "<invariant>", "eval"))
+
+
+OPERATIONS = {
+    InvariantType.EQ: operator.eq, InvariantType.NE: operator.ne, InvariantType.GT: operator.gt,
+    InvariantType.GE: operator.ge, InvariantType.LT: operator.lt, InvariantType.LE: operator.le,
+    InvariantType.ADD: operator.add, InvariantType.SUB: operator.sub, InvariantType.MUL: operator.mul,
+    InvariantType.DIV: operator.floordiv,
+    InvariantType.AND: lambda x, y: bool(x) and bool(y),
+    InvariantType.OR: lambda x, y: bool(x) or bool(y),
+    InvariantType.XOR: lambda x, y: bool(x) != bool(y),
+}
+
+
+class ExpressionDag():
+    # Hash-consed expression nodes: structurally equal subterms of different
+    # invariants share one node. Children always have smaller ids.
+    nodes: List[Tuple[InvariantType, int, int, int]]
+    index: Dict[tuple, int]
+
+    def __init__(self):
+        self.nodes = list()
+        self.index = dict()
+
+    def add(self, inv: Invariant) -> int:
+        left = self.add(inv.left) if inv.left is not None else -1
+        right = self.add(inv.right) if inv.right is not None else -1
+        key = (inv.inv_type, inv.data, left, right)
+        if key not in self.index:
+            self.index[key] = len(self.nodes)
+            self.nodes.append(key)
+        return self.index[key]
+
+    def evaluate(self, roots: List[int], vals_list: List[Dict[int, int]]) -> Dict[int, list]:
+        # Compute the column of every node the roots depend on, once each
+        needed = set()
+        stack = list(roots)
+        while len(stack) > 0:
+            node = stack.pop()
+            if node in needed:
+                continue
+            needed.add(node)
+            _, _, left, right = self.nodes[node]
+            stack.extend(child for child in (left, right) if child >= 0)
+        columns: Dict[int, list] = dict()
+        for node in sorted(needed):
+            inv_type, data, left, right = self.nodes[node]
+            if inv_type == InvariantType.VAR:
+                columns[node] = [vals[data] for vals in vals_list]
+            elif inv_type == InvariantType.CONST:
+                columns[node] = [data] * len(vals_list)
+            elif inv_type == InvariantType.NOT:
+                columns[node] = [not x for x in columns[left]]
+            else:
+                columns[node] = list(map(OPERATIONS[inv_type], columns[left], columns[right]))
+        return columns
+
+
+@register_engine
+class SharedEngine(CompiledEngine):
+    # Evaluates blocks of invariants column by column over chunks of
+    # valuations; shared subterms such as (v1 - v2) or (v1 * k) are computed
+    # once per chunk for all comparisons using them
+    name = "shared"
+    block_size: int = 4096
+    # Chunks grow from first_chunk to max_chunk valuations, so most refuted
+    # candidates are dropped after a few valuations
+    first_chunk: int = 8
+    max_chunk: int = 1024
+
+    def chunks(self, total: int) -> Iterator[Tuple[int, int]]:
+        start = 0
+        size = self.first_chunk
+        while start < total:
+            yield start, min(start + size, total)
+            start += size
+            size = min(size * 2, self.max_chunk)
+
+    def truth_vectors(self, invs: List[Invariant], vals_list: List[Dict[int, int]]) -> List[int]:
+        # Blocks of invariants and chunks of valuations bound the columns kept at once
+        vectors = list()
+        for start in range(0, len(invs), self.block_size):
+            dag = ExpressionDag()
+            roots = [dag.add(inv) for inv in invs[start:start + self.block_size]]
+            block_vectors = [0] * len(roots)
+            for offset in range(0, len(vals_list), self.max_chunk):
+                columns = dag.evaluate(roots, vals_list[offset:offset + self.max_chunk])
+                for i, root in enumerate(roots):
+                    block_vectors[i] |= pack_bits(columns[root]) << offset
+            vectors.extend(block_vectors)
+        return vectors
+
+    def validate_block(self, block: List[Invariant], neg_vals, pos_vals, max_violations: int,
+                       neg_counts: Optional[List[int]] = None,
+                       pos_counts: Optional[List[int]] = None) -> List[Invariant]:
+        # Violations are counted per chunk, so a candidate is dropped at the
+        # end of the first chunk where it exceeds max_violations. Each
+        # valuation stands for counts[i] valuations, 1 by default.
+        if neg_counts is None:
+            neg_counts = [1] * len(neg_vals)
+        if pos_counts is None:
+            pos_counts = [1] * len(pos_vals)
+        dag = ExpressionDag()
+        alive = [(inv, dag.add(inv), 0) for inv in block]
+        # negative validation: invariant should be false
+        for start, end in self.chunks(len(neg_vals)):
+            if len(alive) == 0:
+                break
+            columns = dag.evaluate([root for _, root, _ in alive], neg_vals[start:end])
+            counts = neg_counts[start:end]
+            alive = [(inv, root, violations + sum(compress(counts, columns[root])))
+                     for inv, root, violations in alive]
+            alive = [entry for entry in alive if entry[2] <= max_violations]
+        # positive validation: invariant should be true
+        for start, end in self.chunks(len(pos_vals)):
+            if len(alive) == 0:
+                break
+            columns = dag.evaluate([root for _, root, _ in alive], pos_vals[start:end])
+            counts = pos_counts[start:end]
+            total = sum(counts)
+            alive = [(inv, root, violations + total - sum(compress(counts, columns[root])))
+                     for inv, root, violations in alive]
+            alive = [entry for entry in alive if entry[2] <= max_violations]
+        for inv, _, violations in alive:
+            inv.violations = violations
+        return [inv for inv, _, _ in alive]
+
+    def iter_validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                      max_violations: int = 0) -> Iterator[Invariant]:
+        for start in range(0, len(hypothesis_space), self.block_size):
+            block = hypothesis_space[start:start + self.block_size]
+            try:
+                survivors = self.validate_block(block, neg_vals, pos_vals, max_violations)
+            except (ArithmeticError, LookupError):
+                # Columns evaluate valuations that the reference would skip
+                # after an early exit; redo the block one invariant at a time
+                print_debug(f"Evaluation error in block at {start}, falling back to per-invariant evaluation")
+                survivors = super().iter_validate(block, neg_vals, pos_vals, max_violations)
+            yield from survivors
+
+
+class ProjectionIndex():
+    # Distinct projections of valuations onto tuples of variables, with the
+    # number of valuations each one stands for; built once per tuple
+    vals_list: List[Dict[int, int]]
+    projections: Dict[Tuple[int, ...], Tuple[List[Dict[int, int]], List[int]]]
+
+    def __init__(self, vals_list: List[Dict[int, int]]):
+        self.vals_list = vals_list
+        self.projections = dict()
+
+    def project(self, var_ids: Tuple[int, ...]) -> Tuple[List[Dict[int, int]], List[int]]:
+        if var_ids not in self.projections:
+            if len(var_ids) == 0:
+                counts = Counter({(): len(self.vals_list)} if len(self.vals_list) > 0 else {})
+            else:
+                counts = Counter(zip(*[map(operator.itemgetter(id), self.vals_list) for id in var_ids]))
+            self.projections[var_ids] = ([dict(zip(var_ids, values)) for values in counts], list(counts.values()))
+        return self.projections[var_ids]
+
+
+@register_engine
+class ProjectedEngine(SharedEngine):
+    # Groups candidates by the variables they read, e.g. all ge_var,
+    # diff_ge_const and ge_div_const candidates on (v1, v2), and validates
+    # each group on the distinct projections of the valuations onto those
+    # variables. Cost scales with value diversity instead of sample count.
+    name = "projected"
+    # Valuations checked directly first, at most half of each side; most
+    # refuted candidates never reach the projections, which are only built
+    # for the groups still alive
+    prefix: int = 1024
+
+    def iter_validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                      max_violations: int = 0) -> Iterator[Invariant]:
+        neg_prefix = min(self.prefix, len(neg_vals) // 2)
+        pos_prefix = min(self.prefix, len(pos_vals) // 2)
+        neg_index = ProjectionIndex(neg_vals[neg_prefix:])
+        pos_index = ProjectionIndex(pos_vals[pos_prefix:])
+        for start in range(0, len(hypothesis_space), self.block_size):
+            block = hypothesis_space[start:start + self.block_size]
+            try:
+                alive = self.validate_block(block, neg_vals[:neg_prefix], pos_vals[:pos_prefix], max_violations)
+                # Continue with the budget left after the prefix
+                groups: Dict[Tuple[int, ...], List[Invariant]] = dict()
+                for inv in alive:
+                    collector = VariableCollector()
+                    collector.visit(inv)
+                    groups.setdefault(tuple(sorted(collector.get_vars())), list()).append(inv)
+                validated = set()
+                for var_ids, group in groups.items():
+                    neg_projected, neg_counts = neg_index.project(var_ids)
+                    pos_projected, pos_counts = pos_index.project(var_ids)
+
+                    def validate(invs, neg, pos, budget):
+                        return self.validate_block(invs, neg, pos, budget, neg_counts, pos_counts)
+
+                    for inv in self.iter_validate_continue(group, neg_projected, pos_projected, max_violations,
+                                                           [inv.violations for inv in group], validate):
+                        validated.add(id(inv))
+                survivors = [inv for inv in block if id(inv) in validated]
+            except (ArithmeticError, LookupError):
+                print_debug(f"Evaluation error in block at {start}, falling back to per-invariant evaluation")
+                survivors = Engine.iter_validate(self, block, neg_vals, pos_vals, max_violations)
+            yield from survivors
+
+
+def get_engine(name: str, synthesizer: Synthesizer) -> Engine:
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name}: choose from {', '.join(ENGINES)}")
+    return ENGINES[name](synthesizer)
+
+
+class Mismatch(NamedTuple):
+    inv: Invariant
+    # None when the validation outcome on all sampled valuations differs
+    vals: Optional[Dict[int, int]]
+    expected: str
+    actual: str
+
+
+def outcome(evaluate: Evaluator, vals: Dict[int, int]) -> str:
+    # Exceptions (e.g. division by zero) are part of the observable behaviour
+    try:
+        return repr(evaluate(vals))
+    except Exception as e:
+        return f"{type(e).__name__}"
+
+
+def validation_outcomes(engine: Engine, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                        max_violations: int) -> Dict[int, str]:
+    # Outcome of every candidate, by id, through the engine's validation path
+    outcomes = {id(inv): "refuted" for inv in hypothesis_space}
+    for inv in engine.iter_validate(hypothesis_space, neg_vals, pos_vals, max_violations):
+        outcomes[id(inv)] = f"survives with {inv.violations} violations"
+    return outcomes
+
+
+def cross_check(engine: Engine, hypothesis_space: List[Invariant], neg_vals: List[Dict[int, int]],
+                pos_vals: List[Dict[int, int]], samples: int, seed: int = 0,
+                max_violations: int = 0) -> List[Mismatch]:
+    # Compare the engine with the reference one on a random subset of valuations
+    reference = ReferenceEngine(engine.synthesizer)
+    labelled = [(vals, False) for vals in neg_vals] + [(vals, True) for vals in pos_vals]
+    if samples < len(labelled):
+        labelled = random.Random(seed).sample(labelled, samples)
+    vals_list = [vals for vals, _ in labelled]
+    print_debug(f"Cross-check {engine.name} on {len(hypothesis_space)} invariants and {len(vals_list)} valuations")
+    mismatches = list()
+    batch = list()
+    for inv in hypothesis_space:
+        expected_eval = reference.evaluator(inv)
+        actual_eval = engine.evaluator(inv)
+        failed = False
+        for vals in vals_list:
+            expected = outcome(expected_eval, vals)
+            actual = outcome(actual_eval, vals)
+            if expected != actual:
+                mismatches.append(Mismatch(inv, vals, expected, actual))
+            failed = failed or expected != actual or expected not in ["True", "False"]
+        if not failed:
+            batch.append(inv)
+    # Also check the batched path on the invariants that agree and evaluate cleanly
+    for inv, vector in zip(batch, engine.truth_vectors(batch, vals_list)):
+        expected_vector = reference.truth_vector(inv, vals_list)
+        for i, vals in enumerate(vals_list):
+            expected = bool(expected_vector >> i & 1)
+            actual = bool(vector >> i & 1)
+            if expected != actual:
+                mismatches.append(Mismatch(inv, vals, repr(expected), repr(actual)))
+    # And the validation path used by learn, with its violation counts
+    neg_sample = [vals for vals, positive in labelled if not positive]
+    pos_sample = [vals for vals, positive in labelled if positive]
+    expected_outcomes = validation_outcomes(reference, batch, neg_sample, pos_sample, max_violations)
+    actual_outcomes = validation_outcomes(engine, batch, neg_sample, pos_sample, max_violations)
+    for inv in batch:
+        if expected_outcomes[id(inv)] != actual_outcomes[id(inv)]:
+            mismatches.append(Mismatch(inv, None, expected_outcomes[id(inv)], actual_outcomes[id(inv)]))
+    return mismatches
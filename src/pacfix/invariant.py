@@ -67,6 +67,10 @@ class Invariant():
     data: int
     left: Optional['Invariant']
     right: Optional['Invariant']
+    # Template family that generated this invariant, if any
+    family: Optional[str] = None
+    # Valuations violated by this invariant, set when it survives validation
+    violations: int = 0
 
     def __init__(self, inv_type: InvariantType, left: Optional['Invariant'] = None, right: Optional['Invariant'] = None, data: int = 0):
         self.inv_type = inv_type
@@ -96,6 +100,20 @@ class Invariant():
     def __repr__(self) -> str:
         return str(self)
 
+    def key(self) -> tuple:
+        # Structural key: equal for structurally identical invariants
+        left = self.left.key() if self.left is not None else None
+        right = self.right.key() if self.right is not None else None
+        return (self.inv_type.value, self.data, left, right)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Invariant):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
     def to_str(self, lv: Dict[int, LiveVariable]) -> str:
         if self.inv_type == InvariantType.VAR:
             return lv[self.data].name
@@ -112,6 +130,16 @@ class Invariant():
                 exit(1)
             return f"({self.left.to_str(lv)} {INVARIANT_MAP[self.inv_type]} {self.right.to_str(lv)})"
 
+    def to_dict(self, lv: Dict[int, LiveVariable]) -> dict:
+        if self.inv_type == InvariantType.VAR:
+            return {"type": self.inv_type.name, "id": self.data, "name": lv[self.data].name}
+        elif self.inv_type == InvariantType.CONST:
+            return {"type": self.inv_type.name, "value": self.data}
+        elif self.inv_type == InvariantType.NOT:
+            return {"type": self.inv_type.name, "left": self.left.to_dict(lv)}
+        else:
+            return {"type": self.inv_type.name, "left": self.left.to_dict(lv), "right": self.right.to_dict(lv)}
+
     def result_type(self, lv: Dict[int, LiveVariable]) -> VarType:
         if self.inv_type == InvariantType.VAR:
             return lv[self.data].var_type
@@ -292,9 +320,12 @@ class InvariantManager():
         if model:
             print_debug(f"Model: {model}")
 
-    def dump(self, output: TextIO, out_smt_dir: Optional[str]):
+    def dump(self, output: TextIO, out_smt_dir: Optional[str], show_violations: bool = False):
         for i, inv in enumerate(self.invs):
-            output.write(f"[invariant] [expr {inv.to_str(self.live_vars)}]\n")
+            if show_violations:
+                output.write(f"[invariant] [expr {inv.to_str(self.live_vars)}] [violations {inv.violations}]\n")
+            else:
+                output.write(f"[invariant] [expr {inv.to_str(self.live_vars)}]\n")
             if out_smt_dir is not None:
                 smt_inv = inv.convert_to_smt(self.live_vars)
                 smt.write_smtlib(smt_inv, f"{out_smt_dir}/{i}.smt")
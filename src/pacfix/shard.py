@@ -0,0 +1,119 @@
+from typing import List, Dict, NamedTuple, Optional, TextIO, Tuple
+import json
+
+from . import Metadata, prepare, check_engine
+from .invariant import Invariant, LiveVariable
+from .synthesis import Synthesizer
+from .canonical import Canonicalizer
+from .engines import get_engine
+from .utils import get_fingerprint
+from .debug import print_debug
+
+SPLITS = ["space", "samples"]
+
+
+class Shard(NamedTuple):
+    # Partial result of validating one slice of the work
+    index: int
+    count: int
+    split: str
+    fingerprint: str
+    live_vars: List[Tuple[int, str, str]]
+    binary_vars: List[int]
+    const_pools: Optional[List[Tuple[List[int], List[int]]]]
+    pac_delta: float
+    metadata: Metadata
+    # Positions of the survivors in the deduplicated hypothesis space
+    survivors: List[int]
+
+
+def get_slice(items: list, index: int, count: int) -> list:
+    return items[len(items) * index // count:len(items) * (index + 1) // count]
+
+
+def learn_shard(live_vars: Dict[int, LiveVariable],
+                neg_vals_init: List[Dict[int, int]],
+                pos_vals_init: List[Dict[int, int]],
+                pac_delta: float,
+                index: int,
+                count: int,
+                split: str = "space",
+                engine: str = "reference",
+                cross_check_samples: int = 0,
+                const_mode: str = "default",
+                const_cap: int = 32) -> Shard:
+    # Validate slice index of count of either the hypothesis space or the
+    # valuations; every shard prepares the same deterministic problem
+    if split not in SPLITS:
+        raise ValueError(f"Unknown split {split}: choose from {', '.join(SPLITS)}")
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index {index} is out of range for {count} shards")
+    problem = prepare(live_vars, neg_vals_init, pos_vals_init, pac_delta, 1, const_mode, const_cap)
+    evaluation_engine = get_engine(engine, problem.synthesizer)
+    if cross_check_samples > 0:
+        check_engine(evaluation_engine, problem, cross_check_samples)
+    positions = {id(inv): i for i, inv in enumerate(problem.hypothesis_space)}
+    if split == "space":
+        space = get_slice(problem.hypothesis_space, index, count)
+        neg_vals, pos_vals = problem.neg_vals, problem.pos_vals
+    else:
+        space = problem.hypothesis_space
+        neg_vals = get_slice(problem.neg_vals, index, count)
+        pos_vals = get_slice(problem.pos_vals, index, count)
+    print_debug(f"Shard {index}/{count}: {len(space)} invariants, {len(neg_vals)} neg, {len(pos_vals)} pos")
+    survivors = [positions[id(inv)] for inv in evaluation_engine.iter_validate(space, neg_vals, pos_vals)]
+    const_pools = problem.synthesizer.const_pools
+    if const_pools is not None:
+        const_pools = [(list(key), pool) for key, pool in const_pools.items()]
+    return Shard(index, count, split, get_fingerprint(problem.hypothesis_space),
+        [(v.id, v.name, v.var_type.name.lower()) for v in live_vars.values()],
+        sorted(problem.binary_vars), const_pools, pac_delta, problem.metadata, survivors)
+
+
+def dump_shard(shard: Shard, output: TextIO):
+    record = shard._asdict()
+    record["metadata"] = shard.metadata._asdict()
+    json.dump(record, output)
+    output.write("\n")
+
+
+def load_shard(input: TextIO) -> Shard:
+    record = json.load(input)
+    record["live_vars"] = [tuple(v) for v in record["live_vars"]]
+    record["metadata"] = Metadata(**record["metadata"])
+    return Shard(**record)
+
+
+def merge_shards(shards: List[Shard]) -> Tuple[Dict[int, LiveVariable], Metadata, List[Invariant]]:
+    # Combine partial results into the final survivors, in hypothesis-space order
+    if len(shards) == 0:
+        raise ValueError("No shards to merge")
+    first = shards[0]
+    for shard in shards:
+        if (shard.count, shard.split, shard.fingerprint, shard.pac_delta, shard.metadata) != \
+                (first.count, first.split, first.fingerprint, first.pac_delta, first.metadata):
+            raise ValueError(f"Shard {shard.index} does not belong to the same run as shard {first.index}")
+    indices = sorted(shard.index for shard in shards)
+    if indices != list(range(first.count)):
+        raise ValueError(f"Expected shards 0..{first.count - 1}, got {indices}")
+
+    live_vars = {id: LiveVariable(id, name, var_type) for id, name, var_type in first.live_vars}
+    const_pools = None
+    if first.const_pools is not None:
+        const_pools = {tuple(key): pool for key, pool in first.const_pools}
+    hypothesis_space = Synthesizer(live_vars, const_pools).synthesize()
+    hypothesis_space = Canonicalizer(live_vars, set(first.binary_vars)).dedup(hypothesis_space)
+    if get_fingerprint(hypothesis_space) != first.fingerprint:
+        raise ValueError("Hypothesis space differs from the one the shards were validated on")
+
+    if first.split == "space":
+        # Each candidate was validated by exactly one shard
+        survivors = set()
+        for shard in shards:
+            survivors.update(shard.survivors)
+    else:
+        # A candidate survives only if it survived every slice of valuations
+        survivors = set(first.survivors)
+        for shard in shards[1:]:
+            survivors.intersection_update(shard.survivors)
+    return live_vars, first.metadata, [hypothesis_space[i] for i in sorted(survivors)]
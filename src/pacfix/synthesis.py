@@ -1,20 +1,80 @@
-from typing import List, Set, Dict, Tuple, Union
+from typing import List, Set, Dict, Tuple, Union, Iterator, Optional, Callable
 
 from . import utils
 from . import invariant
 from .invariant import Invariant, InvariantType
 from .debug import print_debug
 
+import collections
 import enum
+import itertools
 import sys
 
+def popcount(vector: int) -> int:
+    return bin(vector).count("1")
+
+
+BITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def pack_bits(outcomes: list) -> int:
+    # Bit i is set iff outcomes[i] is true
+    return int(bytes(map(bool, reversed(outcomes))).translate(BITS) or b"0", 2)
+
+
+CONST_MODES = ["default", "data"]
+
+ConstPools = Dict[Tuple[int, ...], List[int]]
+
+
+def get_const_pool(groups: List[List[int]], cap: int) -> List[int]:
+    # Observed boundaries first, then their neighbours, then frequent values;
+    # each group (negative and positive values) contributes in turn
+    counters = [collections.Counter(values) for values in groups if len(values) > 0]
+    candidates = list()
+    for counter in counters:
+        candidates.extend([min(counter), max(counter)])
+    for counter in counters:
+        low, high = min(counter), max(counter)
+        candidates.extend([low - 1, low + 1, high - 1, high + 1])
+    frequent = [[value for value, _ in counter.most_common()] for counter in counters]
+    for rank in range(max(map(len, frequent), default=0)):
+        candidates.extend(values[rank] for values in frequent if rank < len(values))
+    pool = list()
+    for value in candidates:
+        if len(pool) >= cap:
+            break
+        if value not in pool:
+            pool.append(value)
+    return sorted(pool)
+
+
+def get_const_pools(live_vars: Dict[int, invariant.LiveVariable], neg_vals, pos_vals, cap: int) -> ConstPools:
+    pools: ConstPools = dict()
+    for v in live_vars.values():
+        groups = [[vals[v.id] for vals in group if v.id in vals] for group in [neg_vals, pos_vals]]
+        pools[(v.id,)] = get_const_pool(groups, cap)
+    for v1 in live_vars.values():
+        for v2 in live_vars.values():
+            if v1.id == v2.id or v1.var_type != v2.var_type:
+                continue
+            groups = [[vals[v1.id] - vals[v2.id] for vals in group if v1.id in vals and v2.id in vals]
+                      for group in [neg_vals, pos_vals]]
+            pools[(v1.id, v2.id)] = get_const_pool(groups, cap)
+    return pools
+
+
 class Synthesizer():
     live_vars: Dict[int, invariant.LiveVariable]
     special_values: List[int]
+    # Constants per variable (id,) or variable pair (id1, id2) mined from the
+    # valuations; None for the fixed ranges of get_const_list
+    const_pools: Optional[ConstPools]
 
-    def __init__(self, live_vars: Dict[int, invariant.LiveVariable]):
+    def __init__(self, live_vars: Dict[int, invariant.LiveVariable], const_pools: Optional[ConstPools] = None):
         self.live_vars = live_vars
         self.special_values = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2147483647, 4294967295] # 2048, 4096, 8192, 16384, 32768, 65536, 1048575, 
+        self.const_pools = const_pools
     
     def get_const_list(self, lowerbound: int, upperbound: int) -> List[int]:
         const_list = list(range(lowerbound, upperbound + 1))
@@ -22,12 +82,16 @@ class Synthesizer():
             if i > upperbound:
                 const_list.append(i)
         return const_list
+
+    def get_consts(self, key: Tuple[int, ...], lowerbound: int, upperbound: int) -> List[int]:
+        if self.const_pools is None:
+            return self.get_const_list(lowerbound, upperbound)
+        return self.const_pools.get(key, [])
      
     def gen_eq_const(self, var: List[invariant.LiveVariable]) -> List[Invariant]:
         invariants = list()
-        const_list = self.get_const_list(-10, 100)
         for v in var:
-            for i in const_list:
+            for i in self.get_consts((v.id,), -10, 100):
                 if i == 0:
                     continue
                 invariants.append(Invariant(InvariantType.EQ, Invariant(InvariantType.VAR, data=v.id), Invariant(InvariantType.CONST, data=i)))
@@ -42,9 +106,8 @@ class Synthesizer():
     
     def gen_ne_const(self, var: List[invariant.LiveVariable]) -> List[Invariant]:
         invariants = list()
-        const_list = self.get_const_list(-10, 10)
         for v in var:
-            for i in const_list:
+            for i in self.get_consts((v.id,), -10, 10):
                 if i == 0:
                     continue
                 invariants.append(Invariant(InvariantType.NE, Invariant(InvariantType.VAR, data=v.id), Invariant(InvariantType.CONST, data=i)))
@@ -52,17 +115,15 @@ class Synthesizer():
     
     def gen_ge_const(self, var: List[invariant.LiveVariable]) -> List[Invariant]:
         invariants = list()
-        const_list = self.get_const_list(-10, 10)
         for v in var:
-            for i in const_list:
+            for i in self.get_consts((v.id,), -10, 10):
                 invariants.append(Invariant(InvariantType.GE, Invariant(InvariantType.VAR, data=v.id), Invariant(InvariantType.CONST, data=i)))
         return invariants
     
     def gen_le_const(self, var: List[invariant.LiveVariable]) -> List[Invariant]:
         invariants = list()
-        const_list = self.get_const_list(-10, 10)
         for v in var:
-            for i in const_list:
+            for i in self.get_consts((v.id,), -10, 10):
                 invariants.append(Invariant(InvariantType.LE, Invariant(InvariantType.VAR, data=v.id), Invariant(InvariantType.CONST, data=i)))
         return invariants
     
@@ -78,14 +139,15 @@ class Synthesizer():
 
     def gen_diff_ge_const(self, var: List[invariant.LiveVariable]) -> List[Invariant]:
         invariants = list()
-        const_list = self.get_const_list(1, 10)
         for v1 in var:
             for v2 in var:
                 if v1.id == v2.id:
                     continue
                 if v1.var_type != v2.var_type:
                     continue
-                for i in const_list:
+                for i in self.get_consts((v1.id, v2.id), 1, 10):
+                    if i < 1:
+                        continue
                     invariants.append(Invariant(InvariantType.GE, Invariant(InvariantType.SUB, Invariant(InvariantType.VAR, data=v1.id), Invariant(InvariantType.VAR, data=v2.id)), Invariant(InvariantType.CONST, data=i)))
         return invariants
     
@@ -130,7 +192,27 @@ class Synthesizer():
             return self.evaluate(inv.left, vals) * self.evaluate(inv.right, vals)
         elif inv_type == InvariantType.DIV:
             return self.evaluate(inv.left, vals) // self.evaluate(inv.right, vals)
+        elif inv_type == InvariantType.AND:
+            return bool(self.evaluate(inv.left, vals)) and bool(self.evaluate(inv.right, vals))
+        elif inv_type == InvariantType.OR:
+            return bool(self.evaluate(inv.left, vals)) or bool(self.evaluate(inv.right, vals))
+        elif inv_type == InvariantType.NOT:
+            return not self.evaluate(inv.left, vals)
+        elif inv_type == InvariantType.XOR:
+            return bool(self.evaluate(inv.left, vals)) != bool(self.evaluate(inv.right, vals))
+
+    def truth_vector(self, inv: Invariant, vals_list: List[Dict[int, int]]) -> int:
+        # Bit i is set iff the invariant holds on vals_list[i]
+        return pack_bits([self.evaluate(inv, vals) for vals in vals_list])
+
+    def truth_vectors(self, invs: List[Invariant], vals_list: List[Dict[int, int]]) -> List[int]:
+        return [self.truth_vector(inv, vals_list) for inv in invs]
     
+    def tag(self, family: str, invariants: List[Invariant]) -> List[Invariant]:
+        for inv in invariants:
+            inv.family = family
+        return invariants
+
     def synthesize(self) -> List[Invariant]:
         # Synthesize a program that fits the given patches
         # and satisfies the given constraints
@@ -138,45 +220,130 @@ class Synthesizer():
         int_live_vars = [v for v in live_vars if v.var_type == utils.VarType.INT]
         invariants = list()
         # Equal to a constant
-        invariants.extend(self.gen_eq_const(int_live_vars))
+        invariants.extend(self.tag("eq_const", self.gen_eq_const(int_live_vars)))
         # Non zero
-        invariants.extend(self.gen_zero_non_zero(live_vars))
+        invariants.extend(self.tag("zero_non_zero", self.gen_zero_non_zero(live_vars)))
         # Not equal to a constant
-        invariants.extend(self.gen_ne_const(int_live_vars))
+        invariants.extend(self.tag("ne_const", self.gen_ne_const(int_live_vars)))
         # Greater than or equal to a constant
-        invariants.extend(self.gen_ge_const(int_live_vars))
+        invariants.extend(self.tag("ge_const", self.gen_ge_const(int_live_vars)))
         # Less than or equal to a constant
-        invariants.extend(self.gen_le_const(int_live_vars))
+        invariants.extend(self.tag("le_const", self.gen_le_const(int_live_vars)))
         # Greater than or equal to a variable
-        invariants.extend(self.gen_ge_var(live_vars))
+        invariants.extend(self.tag("ge_var", self.gen_ge_var(live_vars)))
         # Diff greater or equal than a constant
-        invariants.extend(self.gen_diff_ge_const(live_vars))
+        invariants.extend(self.tag("diff_ge_const", self.gen_diff_ge_const(live_vars)))
         # Div result greater than a constant
-        invariants.extend(self.gen_ge_div_const(live_vars))
+        invariants.extend(self.tag("ge_div_const", self.gen_ge_div_const(live_vars)))
         return invariants
         
-    def validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals) -> List[Invariant]:
+    def validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                 max_violations: int = 0) -> List[Invariant]:
         # Reduce the given patches to a minimal set
         # that still satisfies the given constraints
-        refined = list()
+        return list(self.iter_validate(hypothesis_space, neg_vals, pos_vals, max_violations))
+
+    def iter_validate(self, hypothesis_space: List[Invariant], neg_vals, pos_vals,
+                      max_violations: int = 0) -> Iterator[Invariant]:
+        # Yield each surviving invariant as soon as it is validated. It may
+        # violate up to max_violations valuations, recorded in inv.violations
         for inv in hypothesis_space:
-            valid = True
+            violations = 0
             # negative validation: invariant should be false
             for vals in neg_vals:
                 if self.evaluate(inv, vals):
-                    valid = False
-                    break
-            if not valid:
+                    violations += 1
+                    if violations > max_violations:
+                        break
+            if violations > max_violations:
                 print_debug(f"Invalid neg: {inv} from {vals}")
                 continue
             # positive validation: invariant should be true
             for vals in pos_vals:
                 if not self.evaluate(inv, vals):
-                    valid = False
-                    print_debug(f"Invalid pos: {inv} from {vals}")
+                    violations += 1
+                    if violations > max_violations:
+                        print_debug(f"Invalid pos: {inv} from {vals}")
+                        break
+            if violations <= max_violations:
+                inv.violations = violations
+                yield inv
+
+    def combine(self, hypothesis_space: List[Invariant], neg_vals, pos_vals, depth: int,
+                truth_vectors: Optional[Callable[[List[Invariant], List[Dict[int, int]]], List[int]]] = None,
+                iter_validate: Optional[Callable[..., Iterator[Invariant]]] = None) -> List[Invariant]:
+        # Search conjunctions and disjunctions of up to depth atoms.
+        # A conjunction is valid iff every atom holds on all positives and
+        # the bitwise and of their negative vectors is empty. A disjunction is
+        # valid iff every atom fails on all negatives and the bitwise and of
+        # their complemented positive vectors is empty.
+        if truth_vectors is None:
+            truth_vectors = self.truth_vectors
+        if iter_validate is None:
+            iter_validate = self.iter_validate
+        positions = {id(inv): i for i, inv in enumerate(hypothesis_space)}
+        # Only atoms valid on one side can take part, so vectors are built
+        # for the other side of those atoms only
+        # Validating one side overwrites the violations of survivors already
+        # reported, so they are restored afterwards
+        spent = [inv.violations for inv in hypothesis_space]
+        conj_invs = list(iter_validate(hypothesis_space, [], pos_vals))
+        disj_invs = list(iter_validate(hypothesis_space, neg_vals, []))
+        for inv, violations in zip(hypothesis_space, spent):
+            inv.violations = violations
+        pos_full = (1 << len(pos_vals)) - 1
+        conj_atoms: List[Tuple[int, int]] = [(positions[id(inv)], vector)
+            for inv, vector in zip(conj_invs, truth_vectors(conj_invs, neg_vals)) if vector != 0]
+        disj_atoms: List[Tuple[int, int]] = [(positions[id(inv)], pos_full & ~vector)
+            for inv, vector in zip(disj_invs, truth_vectors(disj_invs, pos_vals)) if vector != pos_full]
+        print_debug(f"Combine: {len(conj_atoms)} conjunction atoms, {len(disj_atoms)} disjunction atoms")
+        combined = list()
+        for inv_type, atoms, width in [(InvariantType.AND, conj_atoms, len(neg_vals)),
+                                       (InvariantType.OR, disj_atoms, len(pos_vals))]:
+            for combination in sorted(self.search_combinations(atoms, width, depth)):
+                inv = hypothesis_space[combination[0]]
+                for i in combination[1:]:
+                    inv = Invariant(inv_type, inv, hypothesis_space[i])
+                inv.family = inv_type.name.lower()
+                combined.append(inv)
+        return combined
+
+    def search_combinations(self, atoms: List[Tuple[int, int]], width: int, depth: int) -> List[Tuple[int, ...]]:
+        # Find minimal sets of up to depth atoms whose vectors have an empty intersection
+        atoms = sorted(atoms, key=lambda atom: popcount(atom[1]))
+        counts = [popcount(vector) for _, vector in atoms]
+        result = list()
+
+        def extend(start: int, prefix: List[int], vector: int):
+            last = len(prefix) + 1 == depth
+            count = popcount(vector)
+            for j in range(start, len(atoms)):
+                # Disjoint vectors cannot have more than width bits in total
+                if last and count + counts[j] > width:
                     break
-            if valid:
-                refined.append(inv)
-        return refined
+                rest = vector & atoms[j][1]
+                combination = prefix + [j]
+                if rest == 0:
+                    if self.is_minimal(atoms, combination):
+                        result.append(tuple(sorted(atoms[k][0] for k in combination)))
+                elif not last:
+                    extend(j + 1, combination, rest)
+
+        for i in range(len(atoms)):
+            if depth > 1:
+                extend(i + 1, [i], atoms[i][1])
+        return result
+
+    def is_minimal(self, atoms: List[Tuple[int, int]], combination: List[int]) -> bool:
+        # Every proper subset must still have a non-empty intersection
+        if len(combination) <= 2:
+            return True
+        for sub in itertools.combinations(combination, len(combination) - 1):
+            vector = atoms[sub[0]][1]
+            for k in sub[1:]:
+                vector &= atoms[k][1]
+            if vector == 0:
+                return False
+        return True
     
     
\ No newline at end of file
@@ -1,9 +1,19 @@
 import os
 import math
-from typing import List, Dict, TextIO, Tuple, Set
+import hashlib
+import gzip
+import tarfile
+import zipfile
+from typing import List, Dict, Optional, TextIO, Tuple, Set
 
-from .invariant import LiveVariable, VarType
-from .debug import print_debug
+from .invariant import Invariant, LiveVariable, VarType
+from .debug import print_debug, print_warning
+
+def decode_valuation(name: str, data: bytes) -> str:
+    # Valuation files may be individually gzip-compressed
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    return data.decode()
 
 def get_valuations(input_dir: str) -> List[str]:
     if not os.path.exists(input_dir):
@@ -11,10 +21,73 @@ def get_valuations(input_dir: str) -> List[str]:
         return list()
     valuations = list()
     for file in os.listdir(input_dir):
-        with open(os.path.join(input_dir, file), "r") as f:
-            valuations.append(f.read())
+        with open(os.path.join(input_dir, file), "rb") as f:
+            valuations.append(decode_valuation(file, f.read()))
     return valuations
 
+def get_archive_group(name: str) -> Optional[Tuple[str, str]]:
+    # (root, group) for neg/FILE and pos/FILE, at the top level of the
+    # archive (root "") or under a top-level directory ROOT/neg/FILE
+    parts = [part for part in name.split("/") if part not in ["", "."]]
+    if len(parts) == 2 and parts[0] in ["neg", "pos"]:
+        return "", parts[0]
+    if len(parts) == 3 and parts[1] in ["neg", "pos"]:
+        return parts[0], parts[1]
+    return None
+
+def get_archive_valuations(archive_path: str) -> Tuple[List[str], List[str]]:
+    # Read neg/pos valuation files from a .tar(.gz|.xz|.bz2) or .zip archive
+    # in a single sequential pass, without extracting it to disk. Only one
+    # root is read, so an archive of several runs is never merged into one.
+    neg: List[str] = list()
+    pos: List[str] = list()
+    groups = {"neg": neg, "pos": pos}
+    roots: List[str] = list()
+    ignored: List[str] = list()
+
+    def select(name: str) -> Optional[List[str]]:
+        root_group = get_archive_group(name)
+        if root_group is None:
+            ignored.append(name)
+            return None
+        root, group = root_group
+        if len(roots) == 0:
+            roots.append(root)
+        if root != roots[0]:
+            ignored.append(name)
+            return None
+        return groups[group]
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                group = select(info.filename)
+                if group is not None:
+                    group.append(decode_valuation(info.filename, archive.read(info)))
+    else:
+        with tarfile.open(archive_path, "r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                group = select(member.name)
+                if group is not None:
+                    group.append(decode_valuation(member.name, archive.extractfile(member).read()))
+    if len(ignored) > 0:
+        root = f"{roots[0]}/" if len(roots) > 0 and roots[0] != "" else ""
+        print_warning(f"Archive {archive_path}: ignored {len(ignored)} files outside {root}neg and {root}pos,"
+            f" e.g. {ignored[0]}")
+    print_debug(f"Archive {archive_path}: {len(neg)} neg, {len(pos)} pos files")
+    return neg, pos
+
+def get_input_valuations(input_path: str) -> Tuple[List[str], List[str]]:
+    # Returns raw neg, pos valuations from a directory or an archive
+    if os.path.isdir(input_path):
+        return (get_valuations(os.path.join(input_path, "neg")),
+                get_valuations(os.path.join(input_path, "pos")))
+    return get_archive_valuations(input_path)
+
 # parse valuation and returns neg, pos valuations
 def parse_valuation(neg: List[str], pos: List[str]) -> Tuple[List[Dict[int, int]], List[Dict[int, int]]]:
     neg_vals = list()
@@ -135,4 +208,50 @@ def get_lv_file(lv_file: TextIO) -> Set[str]:
 def calculate_pac(samples: int, hypothesis_space: int, delta: float) -> float:
     if hypothesis_space == 0 or samples == 0:
         return 0
-    return (1 / samples) * (math.log(hypothesis_space) + (math.log(1 / delta)))
\ No newline at end of file
+    return (1 / samples) * (math.log(hypothesis_space) + (math.log(1 / delta)))
+
+
+def calculate_pac_agnostic(samples: int, hypothesis_space: int, delta: float, violations: int) -> float:
+    # Bound for candidates with up to violations errors on the samples
+    # (Hoeffding): violations / samples + sqrt((ln|H| + ln 1/delta) / 2m)
+    if hypothesis_space == 0 or samples == 0:
+        return 0
+    return violations / samples + math.sqrt((math.log(hypothesis_space) + math.log(1 / delta)) / (2 * samples))
+
+
+def calculate_pac_samples(hypothesis_space: int, delta: float, epsilon: float) -> int:
+    # Inverse of calculate_pac: samples needed to reach epsilon
+    if hypothesis_space == 0:
+        return 0
+    return math.ceil((math.log(hypothesis_space) + math.log(1 / delta)) / epsilon)
+
+
+def get_space_size(atoms: int, depth: int) -> int:
+    # Atoms plus every conjunction and disjunction of 2..depth distinct atoms
+    size = atoms
+    subsets = atoms
+    for k in range(2, depth + 1):
+        # Number of k-subsets, from that of (k - 1)-subsets (math.comb needs Python 3.8)
+        subsets = subsets * (atoms - k + 1) // k
+        size += 2 * subsets
+    return size
+
+
+def get_fingerprint(hypothesis_space: List[Invariant]) -> str:
+    # Identifies a hypothesis space, including the order of its candidates
+    digest = hashlib.sha256()
+    for inv in hypothesis_space:
+        digest.update(repr(inv.key()).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def get_valuation_digest(neg_vals: List[Dict[int, int]], pos_vals: List[Dict[int, int]]) -> str:
+    # Identifies deduplicated valuations, including their order
+    digest = hashlib.sha256()
+    for label, vals_list in [(b"neg", neg_vals), (b"pos", pos_vals)]:
+        for vals in vals_list:
+            digest.update(label)
+            digest.update(repr(sorted(vals.items())).encode())
+            digest.update(b"\n")
+    return digest.hexdigest()
@@ -0,0 +1,129 @@
+from typing import Dict, Optional, TextIO
+import json
+import pysmt.shortcuts as smt
+
+from . import Metadata, Result
+from .invariant import Invariant, LiveVariable, VarType, VariableCollector
+
+
+class TextWriter():
+    # Line-based format, written once learning has finished
+    output: TextIO
+    live_vars: Dict[int, LiveVariable]
+    pac_delta: float
+    out_smt_dir: Optional[str]
+    metadata: Optional[Metadata]
+
+    def __init__(self, output: TextIO, live_vars: Dict[int, LiveVariable], pac_delta: float,
+                 out_smt_dir: Optional[str] = None, inline_smt: bool = False):
+        self.output = output
+        self.live_vars = live_vars
+        self.pac_delta = pac_delta
+        self.out_smt_dir = out_smt_dir
+        self.metadata = None
+
+    def write_metadata(self, metadata: Metadata):
+        self.metadata = metadata
+
+    def write_invariant(self, inv: Invariant):
+        pass
+
+    def write_result(self, result: Result):
+        output = self.output
+        metadata = self.metadata
+        int_vars = sum(v.var_type == VarType.INT for v in self.live_vars.values())
+        output.write(f"[metadata] [live-variables] [total {len(self.live_vars)}] [int {int_vars}]\n")
+        # dedup comes last so that parsers of the older format keep working
+        output.write("[metadata] [hypothesis-space]"
+            f" [original {result.size_orig}] [final {result.size_final}]"
+            f" [dedup {result.size_dedup}]\n")
+        output.write("[metadata] [valuation]"
+            f" [neg {result.samples_neg}] [pos {result.samples_pos}]"
+            f" [uniq {result.samples_neg + result.samples_pos}]"
+            f" [init-neg {metadata.samples_neg_init}] [init-pos {metadata.samples_pos_init}]"
+            f" [non-uniq {metadata.samples_neg_init + metadata.samples_pos_init}]\n")
+        output.write(f"[metadata] [pac] [delta {self.pac_delta}]"
+            f" [eps {result.pac_epsilon}]\n")
+        eps_no_uniq = "n/a" if result.pac_epsilon_no_uniq is None else result.pac_epsilon_no_uniq
+        output.write(f"[metadata] [pac-no-uniq] [delta {self.pac_delta}]"
+            f" [eps {eps_no_uniq}]\n")
+        if metadata.const_mode != "default":
+            output.write(f"[metadata] [const-pool] [mode {metadata.const_mode}]"
+                f" [default-dedup {metadata.size_dedup_default}]"
+                f" [default-eps {metadata.pac_epsilon_default}]\n")
+        if metadata.max_violations > 0:
+            output.write(f"[metadata] [tolerance] [max-violations {metadata.max_violations}]"
+                " [bound agnostic]\n")
+        if result.validation_time is not None:
+            output.write(f"[metadata] [validation] [time {result.validation_time:.3f}]\n")
+        output.write("[final] --------------\n")
+        result.inv_mgr.dump(output, self.out_smt_dir, metadata.max_violations > 0)
+
+
+class NdjsonWriter():
+    # One JSON record per line, flushed as soon as it is known
+    output: TextIO
+    live_vars: Dict[int, LiveVariable]
+    pac_delta: float
+    out_smt_dir: Optional[str]
+    inline_smt: bool
+    count: int
+
+    def __init__(self, output: TextIO, live_vars: Dict[int, LiveVariable], pac_delta: float,
+                 out_smt_dir: Optional[str] = None, inline_smt: bool = False):
+        self.output = output
+        self.live_vars = live_vars
+        self.pac_delta = pac_delta
+        self.out_smt_dir = out_smt_dir
+        self.inline_smt = inline_smt
+        self.count = 0
+
+    def write_record(self, record: dict):
+        self.output.write(json.dumps(record) + "\n")
+        self.output.flush()
+
+    def write_metadata(self, metadata: Metadata):
+        int_vars = sum(v.var_type == VarType.INT for v in self.live_vars.values())
+        self.write_record({
+            "type": "metadata",
+            "live_variables": {"total": len(self.live_vars), "int": int_vars},
+            "hypothesis_space": {"original": metadata.size_orig, "dedup": metadata.size_dedup},
+            "valuation": {"neg": metadata.samples_neg, "pos": metadata.samples_pos,
+                          "init_neg": metadata.samples_neg_init, "init_pos": metadata.samples_pos_init},
+            "pac": {"delta": self.pac_delta, "eps": metadata.pac_epsilon,
+                    "eps_no_uniq": metadata.pac_epsilon_no_uniq},
+            "const_pool": {"mode": metadata.const_mode, "default_dedup": metadata.size_dedup_default,
+                           "default_eps": metadata.pac_epsilon_default},
+            "tolerance": {"max_violations": metadata.max_violations,
+                          "bound": "agnostic" if metadata.max_violations > 0 else "realizable"},
+        })
+
+    def write_invariant(self, inv: Invariant):
+        collector = VariableCollector()
+        collector.visit(inv)
+        record = {
+            "type": "invariant",
+            "id": self.count,
+            "expr": inv.to_str(self.live_vars),
+            "ast": inv.to_dict(self.live_vars),
+            "variables": [self.live_vars[id].name for id in sorted(collector.get_vars())],
+            "family": inv.family,
+            "violations": inv.violations,
+        }
+        if self.inline_smt or self.out_smt_dir is not None:
+            smt_inv = inv.convert_to_smt(self.live_vars)
+            if self.inline_smt:
+                record["smt"] = smt.to_smtlib(smt_inv, daggify=False)
+            if self.out_smt_dir is not None:
+                smt.write_smtlib(smt_inv, f"{self.out_smt_dir}/{self.count}.smt")
+        self.write_record(record)
+        self.count += 1
+
+    def write_result(self, result: Result):
+        # The metadata record is written before validation, so the time
+        # spent validating is reported here
+        self.write_record({"type": "final", "hypothesis_space": {"final": result.size_final},
+                           "validation_time": result.validation_time})
+
+
+WRITERS = {"text": TextWriter, "ndjson": NdjsonWriter}
@@ -0,0 +1,13 @@
+import os
+import pacfix
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
+
+
+def load_example01():
+    # Live variables and parsed neg, pos valuations of examples/example01
+    val_dir = os.path.join(EXAMPLES_DIR, "example01", "mem")
+    vals_neg, vals_pos = pacfix.utils.parse_valuation(*pacfix.utils.get_input_valuations(val_dir))
+    with open(os.path.join(EXAMPLES_DIR, "example01", "live-variables.txt"), "r") as f:
+        live_vars = pacfix.utils.get_live_vars(f)
+    return live_vars, vals_neg, vals_pos
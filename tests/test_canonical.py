@@ -0,0 +1,61 @@
+import unittest
+import pacfix
+from pacfix.invariant import Invariant, InvariantType, LiveVariable
+from pacfix.canonical import Canonicalizer, get_binary_vars
+
+
+def var(id: int) -> Invariant:
+    return Invariant(InvariantType.VAR, data=id)
+
+
+def const(c: int) -> Invariant:
+    return Invariant(InvariantType.CONST, data=c)
+
+
+class TestCanonical(unittest.TestCase):
+    def test_equivalent_comparisons(self):
+        live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        canonicalizer = Canonicalizer(live_vars)
+        key = canonicalizer.canonical_key
+        self.assertEqual(key(Invariant(InvariantType.GT, var(1), const(3))),
+                         key(Invariant(InvariantType.GE, var(1), const(4))))
+        self.assertEqual(key(Invariant(InvariantType.LE, var(1), const(5))),
+                         key(Invariant(InvariantType.GE, const(5), var(1))))
+        self.assertEqual(key(Invariant(InvariantType.GE, Invariant(InvariantType.SUB, var(1), var(2)), const(1))),
+                         key(Invariant(InvariantType.GT, var(1), var(2))))
+        self.assertEqual(key(Invariant(InvariantType.NOT, Invariant(InvariantType.EQ, var(1), const(0)))),
+                         key(Invariant(InvariantType.NE, const(0), var(1))))
+        self.assertNotEqual(key(Invariant(InvariantType.GE, var(1), var(2))),
+                            key(Invariant(InvariantType.GE, var(2), var(1))))
+
+    def test_merge_bounds(self):
+        live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        key = Canonicalizer(live_vars).canonical_key
+        diff = Invariant(InvariantType.SUB, var(1), var(2))
+        self.assertEqual(key(Invariant(InvariantType.OR, Invariant(InvariantType.GE, var(1), const(1)),
+                                       Invariant(InvariantType.LE, var(1), const(-1)))),
+                         key(Invariant(InvariantType.NE, var(1), const(0))))
+        self.assertEqual(key(Invariant(InvariantType.AND, Invariant(InvariantType.GE, diff, const(2)),
+                                       Invariant(InvariantType.LE, diff, const(2)))),
+                         key(Invariant(InvariantType.EQ, var(1), Invariant(InvariantType.ADD, var(2), const(2)))))
+        self.assertEqual(key(Invariant(InvariantType.OR, Invariant(InvariantType.GE, var(1), const(2)),
+                                       Invariant(InvariantType.LE, var(1), const(1)))),
+                         key(Invariant(InvariantType.GE, var(1), var(1))))
+        self.assertEqual(key(Invariant(InvariantType.AND, Invariant(InvariantType.GE, var(1), const(2)),
+                                       Invariant(InvariantType.GE, var(1), const(5)))),
+                         key(Invariant(InvariantType.GE, var(1), const(5))))
+        self.assertNotEqual(key(Invariant(InvariantType.OR, Invariant(InvariantType.GE, var(1), const(2)),
+                                          Invariant(InvariantType.LE, var(1), const(-1)))),
+                            key(Invariant(InvariantType.NE, var(1), const(0))))
+
+    def test_dedup_binary(self):
+        live_vars = {1: LiveVariable(1, "a", "bool"), 2: LiveVariable(2, "b", "bool")}
+        space = pacfix.Synthesizer(live_vars).synthesize()
+        vals = [{1: 0, 2: 1}, {1: 1, 2: 1}]
+        deduped = Canonicalizer(live_vars, get_binary_vars(live_vars, vals)).dedup(space)
+        self.assertLess(len(deduped), len(space))
+        # (a * k) <= b is a == 0 on binary variables
+        self.assertNotIn(Invariant(InvariantType.LE, Invariant(InvariantType.MUL, var(1), const(2)), var(2)), deduped)
+        self.assertIn(Invariant(InvariantType.EQ, var(1), const(0)), deduped)
+        # Without the binary domain only exact equivalences are removed
+        self.assertEqual(len(Canonicalizer(live_vars).dedup(space)), len(space))
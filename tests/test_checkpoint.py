@@ -0,0 +1,52 @@
+import unittest
+import os
+import tempfile
+import pacfix
+from pacfix.invariant import LiveVariable
+from pacfix.engines import CompiledEngine
+from pacfix.checkpoint import CheckpointError, load_checkpoint, start_checkpoint, validate_checkpointed
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptingEngine(CompiledEngine):
+    # Fails after a number of calls, as if the worker were killed
+    name = "interrupting"
+    calls: int = 0
+    limit: int = 0
+
+    def iter_validate(self, hypothesis_space, neg_vals, pos_vals, max_violations=0):
+        self.calls += 1
+        if self.calls > self.limit:
+            raise Interrupted()
+        return super().iter_validate(hypothesis_space, neg_vals, pos_vals, max_violations)
+
+
+class TestCheckpoint(unittest.TestCase):
+    def test_resume(self):
+        live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        neg_vals = [{1: x, 2: -x} for x in range(-3, 4)]
+        pos_vals = [{1: x, 2: x % 5} for x in range(40)] + [{1: -1, 2: 3}]
+        problem = pacfix.prepare(live_vars, neg_vals, pos_vals, 0.01, max_violations=2)
+        space = problem.hypothesis_space
+        engine = pacfix.get_engine("compiled", problem.synthesizer)
+        expected = [(inv, inv.violations) for inv in engine.iter_validate(
+            space, problem.neg_vals, problem.pos_vals, 2)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "checkpoint.json")
+            interrupting = InterruptingEngine(problem.synthesizer)
+            interrupting.limit = 3
+            checkpoint = start_checkpoint(path, True, space, problem.neg_vals, problem.pos_vals, 2)
+            with self.assertRaises(Interrupted):
+                validate_checkpointed(interrupting, space, problem.neg_vals, problem.pos_vals,
+                    checkpoint, path, 0, chunk_size=4)
+            checkpoint = start_checkpoint(path, True, space, problem.neg_vals, problem.pos_vals, 2)
+            self.assertGreater(checkpoint.neg_offset + checkpoint.pos_offset, 0)
+            actual = validate_checkpointed(engine, space, problem.neg_vals, problem.pos_vals,
+                checkpoint, path, 0, chunk_size=4)
+            self.assertEqual([(inv, inv.violations) for inv in actual], expected)
+            self.assertEqual(load_checkpoint(path).pos_offset, len(problem.pos_vals))
+            with self.assertRaises(CheckpointError):
+                start_checkpoint(path, True, space, problem.neg_vals, problem.pos_vals[1:], 2)
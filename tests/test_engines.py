@@ -0,0 +1,141 @@
+import unittest
+from unittest import mock
+import pacfix
+from pacfix.invariant import Invariant, InvariantType, LiveVariable
+from pacfix.engines import ENGINES, CompiledEngine, ExpressionDag, ProjectedEngine, ProjectionIndex, SharedEngine, \
+    cross_check, get_engine
+
+
+class WrappingEngine(CompiledEngine):
+    # Emulates 32-bit wrap-around to check that cross-check catches it
+    name = "wrapping"
+
+    def to_source(self, inv: Invariant) -> str:
+        if inv.inv_type == InvariantType.VAR:
+            return f"((v[{inv.data}] + 2**31) % 2**32 - 2**31)"
+        return super().to_source(inv)
+
+
+class AcceptingEngine(SharedEngine):
+    # Evaluates correctly but accepts every candidate in validation
+    name = "accepting"
+
+    def validate_block(self, block, neg_vals, pos_vals, max_violations, neg_counts=None, pos_counts=None):
+        for inv in block:
+            inv.violations = 0
+        return block
+
+
+class UnweightedIndex(ProjectionIndex):
+    # Drops the multiplicities to check that cross-check catches it
+    def project(self, var_ids):
+        projected, counts = super().project(var_ids)
+        return projected, [1] * len(counts)
+
+
+class TestEngines(unittest.TestCase):
+    def setUp(self):
+        self.live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        self.synthesizer = pacfix.Synthesizer(self.live_vars)
+        self.vals = [{1: 4294967295, 2: -7}, {1: -7, 2: 2}, {1: 0, 2: 0}, {1: 2147483648, 2: 3}]
+
+    def test_engines_agree(self):
+        space = self.synthesizer.synthesize()
+        space.append(Invariant(InvariantType.EQ,
+            Invariant(InvariantType.DIV, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.VAR, data=2)),
+            Invariant(InvariantType.CONST, data=-4)))
+        for name in ENGINES:
+            engine = get_engine(name, self.synthesizer)
+            self.assertEqual(cross_check(engine, space, self.vals[:1], self.vals[1:], len(self.vals)), [], name)
+            reference = list(self.synthesizer.iter_validate(space[:-1], self.vals[:1], self.vals[1:]))
+            self.assertEqual(list(engine.iter_validate(space[:-1], self.vals[:1], self.vals[1:])), reference, name)
+
+    def test_cross_check_mismatch(self):
+        engine = WrappingEngine(self.synthesizer)
+        inv = Invariant(InvariantType.EQ, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.CONST, data=-1))
+        mismatches = cross_check(engine, [inv], [], self.vals, len(self.vals))
+        self.assertEqual(len(mismatches), 1)
+        self.assertEqual(mismatches[0].inv, inv)
+        self.assertEqual(mismatches[0].vals, self.vals[0])
+        self.assertEqual((mismatches[0].expected, mismatches[0].actual), ("False", "True"))
+
+    def test_cross_check_validation(self):
+        engine = AcceptingEngine(self.synthesizer)
+        space = self.synthesizer.synthesize()
+        mismatches = cross_check(engine, space, self.vals[:1], self.vals[1:], len(self.vals))
+        refuted = len(space) - len(self.synthesizer.validate(space, self.vals[:1], self.vals[1:]))
+        self.assertEqual(len(mismatches), refuted)
+        self.assertTrue(all(m.vals is None and m.expected == "refuted" for m in mismatches))
+
+    def test_cross_check_projection(self):
+        engine = ProjectedEngine(self.synthesizer)
+        inv = Invariant(InvariantType.NE, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.CONST, data=0))
+        pos = [{1: 0, 2: y} for y in range(6)]
+        self.assertEqual(cross_check(engine, [inv], [], pos, len(pos), max_violations=4), [])
+        # Half of the valuations go through the projection, where x = 0 occurs three times
+        with mock.patch("pacfix.engines.ProjectionIndex", UnweightedIndex):
+            mismatches = cross_check(engine, [inv], [], pos, len(pos), max_violations=4)
+        self.assertEqual([(m.inv, m.vals, m.expected, m.actual) for m in mismatches],
+                         [(inv, None, "refuted", "survives with 4 violations")])
+
+    def test_shared_subterms(self):
+        dag = ExpressionDag()
+        diff = Invariant(InvariantType.SUB, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.VAR, data=2))
+        for k in range(3):
+            dag.add(Invariant(InvariantType.GE, diff, Invariant(InvariantType.CONST, data=k)))
+        # x, y, x - y, three constants and three comparisons
+        self.assertEqual(len(dag.nodes), 9)
+        engine = SharedEngine(self.synthesizer)
+        space = self.synthesizer.synthesize()
+        expected = [self.synthesizer.truth_vector(inv, self.vals) for inv in space]
+        self.assertEqual(engine.truth_vectors(space, self.vals), expected)
+
+    def test_shared_division_fallback(self):
+        # y is zero only after x already refutes the candidate
+        inv = Invariant(InvariantType.OR,
+            Invariant(InvariantType.GE, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.CONST, data=0)),
+            Invariant(InvariantType.EQ,
+                Invariant(InvariantType.DIV, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.VAR, data=2)),
+                Invariant(InvariantType.CONST, data=0)))
+        engine = SharedEngine(self.synthesizer)
+        neg = [{1: 5, 2: 1}, {1: 6, 2: 0}]
+        self.assertEqual(list(engine.iter_validate([inv], neg, [])),
+                         list(self.synthesizer.iter_validate([inv], neg, [])))
+
+    def test_max_violations(self):
+        space = self.synthesizer.synthesize()
+        for max_violations in range(3):
+            expected = [(inv, inv.violations) for inv in
+                        self.synthesizer.iter_validate(space, self.vals[:2], self.vals[2:], max_violations)]
+            self.assertTrue(all(violations <= max_violations for _, violations in expected))
+            for name in ENGINES:
+                engine = get_engine(name, self.synthesizer)
+                actual = [(inv, inv.violations) for inv in
+                          engine.iter_validate(space, self.vals[:2], self.vals[2:], max_violations)]
+                self.assertEqual(actual, expected, name)
+                for sample_size in range(3):
+                    sampled = [(inv, inv.violations) for inv in pacfix.iter_validate_sampled(
+                        engine, space, self.vals[:2], self.vals[2:], sample_size, max_violations=max_violations)]
+                    self.assertEqual(sampled, expected, name)
+                # Continuing on the negative valuations gives the same result
+                first = list(engine.iter_validate(space, self.vals[:1], self.vals[2:], max_violations))
+                continued = [(inv, inv.violations) for inv in engine.iter_validate_continue(
+                    first, self.vals[1:2], [], max_violations, [inv.violations for inv in first])]
+                self.assertEqual(continued, expected, name)
+
+    def test_projection(self):
+        vals = [{1: 1, 2: 2, 3: 0}, {1: 1, 2: 2, 3: 1}, {1: 1, 2: 3, 3: 0}, {1: 1, 2: 2, 3: 2}]
+        index = ProjectionIndex(vals)
+        self.assertEqual(index.project((1, 2)), ([{1: 1, 2: 2}, {1: 1, 2: 3}], [3, 1]))
+        self.assertEqual(index.project((1,)), ([{1: 1}], [4]))
+        self.assertEqual(index.project(()), ([{}], [4]))
+        # Skip the direct prefix so that every valuation goes through projections
+        engine = ProjectedEngine(self.synthesizer)
+        engine.prefix = 1
+        space = self.synthesizer.synthesize()
+        neg, pos = self.vals[:1], self.vals[1:] * 3
+        for max_violations in range(4):
+            expected = [(inv, inv.violations) for inv in
+                        self.synthesizer.iter_validate(space, neg, pos, max_violations)]
+            actual = [(inv, inv.violations) for inv in engine.iter_validate(space, neg, pos, max_violations)]
+            self.assertEqual(actual, expected)
@@ -1,7 +1,9 @@
 import unittest
 import os
 import pacfix
+from pacfix.invariant import LiveVariable
 import pysmt.shortcuts as smt
+from .helpers import load_example01
 
 EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
 
@@ -22,4 +24,49 @@ class TestRun(unittest.TestCase):
         result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1)
         expected = smt.Not(smt.Equals(live_vars[c_id].var, smt.Int(0)))
         for inv in result.inv_mgr.invs:
-            self.assertEqual(inv.convert_to_smt(live_vars), expected)
\ No newline at end of file
+            self.assertEqual(inv.convert_to_smt(live_vars), expected)
+
+    def test_run_data_consts(self):
+        live_vars, vals_neg, vals_pos = load_example01()
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1, const_mode="data")
+        default = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1)
+        self.assertLess(result.size_dedup, default.size_dedup)
+        self.assertLess(result.pac_epsilon, default.pac_epsilon)
+        self.assertEqual(result.inv_mgr.invs, default.inv_mgr.invs)
+        self.assertGreater(result.validation_time, 0)
+
+    def test_run_sampled(self):
+        live_vars, vals_neg, vals_pos = load_example01()
+        problem = pacfix.prepare(live_vars, vals_neg, vals_pos, 0.1)
+        engine = pacfix.get_engine("compiled", problem.synthesizer)
+        expected = list(engine.iter_validate(problem.hypothesis_space, problem.neg_vals, problem.pos_vals))
+        for sample_size in range(len(problem.pos_vals) + 1):
+            survivors = pacfix.iter_validate_sampled(engine, problem.hypothesis_space,
+                problem.neg_vals, problem.pos_vals, sample_size)
+            self.assertEqual(list(survivors), expected)
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1, sample_epsilon=2.0)
+        self.assertEqual(result.inv_mgr.invs, expected)
+
+    def test_run_max_violations(self):
+        live_vars, vals_neg, vals_pos = load_example01()
+        exact = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1)
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1, max_violations=1)
+        self.assertLessEqual(set(exact.inv_mgr.invs), set(result.inv_mgr.invs))
+        self.assertTrue(all(inv.violations <= 1 for inv in result.inv_mgr.invs))
+        samples = result.samples_neg + result.samples_pos
+        self.assertEqual(result.pac_epsilon,
+            pacfix.utils.calculate_pac_agnostic(samples, result.size_dedup, 0.1, 1))
+        self.assertGreater(result.pac_epsilon, exact.pac_epsilon)
+        self.assertIsNone(result.pac_epsilon_no_uniq)
+
+    def test_run_max_violations_combined(self):
+        # Searching combinations must keep the violations of the atoms
+        live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        vals_neg = [{1: -1, 2: 4}, {1: -5, 2: 7}]
+        vals_pos = [{1: k, 2: 2 * k} for k in range(6)] + [{1: -3, 2: 1}]
+        atoms = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1, max_violations=1).inv_mgr.invs
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.1, combine_depth=2, max_violations=1)
+        self.assertTrue(all(inv.violations == 1 for inv in atoms))
+        self.assertGreater(len(result.inv_mgr.invs), len(atoms))
+        self.assertEqual([(inv, inv.violations) for inv in result.inv_mgr.invs[:len(atoms)]],
+                         [(inv, inv.violations) for inv in atoms])
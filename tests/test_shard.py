@@ -0,0 +1,23 @@
+import unittest
+import io
+import pacfix
+from pacfix import shard
+from .helpers import load_example01
+
+
+class TestShard(unittest.TestCase):
+    def test_shard_merge(self):
+        live_vars, vals_neg, vals_pos = load_example01()
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.01)
+        for split in shard.SPLITS:
+            shards = list()
+            for index in range(3):
+                output = io.StringIO()
+                shard.dump_shard(shard.learn_shard(live_vars, vals_neg, vals_pos, 0.01, index, 3, split), output)
+                output.seek(0)
+                shards.append(shard.load_shard(output))
+            _, metadata, refined_space = shard.merge_shards(shards)
+            self.assertEqual(refined_space, result.inv_mgr.invs)
+            self.assertEqual(metadata.pac_epsilon, result.pac_epsilon)
+            with self.assertRaises(ValueError):
+                shard.merge_shards(shards[:2])
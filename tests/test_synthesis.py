@@ -0,0 +1,52 @@
+import unittest
+import pacfix
+from pacfix.invariant import Invariant, InvariantType, LiveVariable
+from pacfix.canonical import Canonicalizer
+
+
+class TestSynthesis(unittest.TestCase):
+    def setUp(self):
+        self.live_vars = {1: LiveVariable(1, "x", "int"), 2: LiveVariable(2, "y", "int")}
+        self.synthesizer = pacfix.Synthesizer(self.live_vars)
+
+    def test_truth_vector(self):
+        inv = Invariant(InvariantType.GE, Invariant(InvariantType.VAR, data=1), Invariant(InvariantType.CONST, data=0))
+        vals = [{1: 3, 2: 0}, {1: -1, 2: 0}, {1: 0, 2: 0}]
+        self.assertEqual(self.synthesizer.truth_vector(inv, vals), 0b101)
+
+    def test_combine(self):
+        # x != 0 only holds as a disjunction of x >= 1 and x <= -1
+        neg_vals = [{1: 0, 2: 5}]
+        pos_vals = [{1: 3, 2: 5}, {1: -4, 2: 5}]
+        space = [inv for inv in self.synthesizer.synthesize() if inv.inv_type != InvariantType.NE]
+        combined = self.synthesizer.combine(space, neg_vals, pos_vals, 2)
+        self.assertTrue(len(combined) > 0)
+        for inv in combined:
+            self.assertFalse(any(self.synthesizer.evaluate(inv, vals) for vals in neg_vals))
+            self.assertTrue(all(self.synthesizer.evaluate(inv, vals) for vals in pos_vals))
+        x = Invariant(InvariantType.VAR, data=1)
+        expected = Invariant(InvariantType.OR,
+                             Invariant(InvariantType.GE, x, Invariant(InvariantType.CONST, data=1)),
+                             Invariant(InvariantType.LE, x, Invariant(InvariantType.CONST, data=-1)))
+        self.assertIn(expected, combined)
+
+    def test_learn_combine_depth(self):
+        neg_vals = [{1: 0, 2: 5}]
+        pos_vals = [{1: 3, 2: 5}, {1: -4, 2: 5}]
+        result = pacfix.learn(self.live_vars, neg_vals, pos_vals, 0.01, combine_depth=2)
+        atoms = len(self.synthesizer.synthesize())
+        self.assertEqual(result.size_orig, pacfix.utils.get_space_size(atoms, 2))
+        self.assertTrue(any(inv.inv_type == InvariantType.OR for inv in result.inv_mgr.invs))
+        # (x >= 1) || (x <= -1) is the atom x != 0
+        keys = [Canonicalizer(self.live_vars).canonical_key(inv) for inv in result.inv_mgr.invs]
+        self.assertEqual(len(set(keys)), len(keys))
+
+    def test_const_pool(self):
+        pool = pacfix.synthesis.get_const_pool([[7], [1, 2, 2, 9, 9, 9, 4]], 10)
+        self.assertEqual(pool, [0, 1, 2, 4, 6, 7, 8, 9, 10])
+        self.assertEqual(pacfix.synthesis.get_const_pool([[7], [1, 2, 2, 9]], 2), [1, 7])
+        pools = pacfix.synthesis.get_const_pools(self.live_vars, [{1: 0, 2: 5}], [{1: 3, 2: 5}], 4)
+        self.assertEqual(pools[(1,)], [-1, 0, 1, 3])
+        self.assertEqual(pools[(1, 2)], [-6, -5, -4, -2])
+        synthesizer = pacfix.Synthesizer(self.live_vars, pools)
+        self.assertLess(len(synthesizer.synthesize()), len(self.synthesizer.synthesize()))
@@ -1,5 +1,9 @@
 import unittest
 import os
+import gzip
+import tarfile
+import tempfile
+import zipfile
 import pacfix
 
 EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "examples")
@@ -16,3 +20,34 @@ class TestValuation(unittest.TestCase):
         self.assertEqual(len(vals_neg), 4)
         vals_neg_final = pacfix.utils.filter_duplicate(vals_neg)
         self.assertEqual(len(vals_neg_final), 3)
+
+    def test_archive(self):
+        val_dir = os.path.join(EXAMPLES_DIR, "example01", "mem")
+        expected = pacfix.utils.get_input_valuations(val_dir)
+        with tempfile.TemporaryDirectory() as tmp:
+            tar_path = os.path.join(tmp, "mem.tar.xz")
+            with tarfile.open(tar_path, "w:xz") as archive:
+                archive.add(val_dir, arcname="mem")
+            zip_path = os.path.join(tmp, "mem.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                for group in ["neg", "pos"]:
+                    for file in os.listdir(os.path.join(val_dir, group)):
+                        with open(os.path.join(val_dir, group, file), "rb") as f:
+                            # Individually compressed valuation files
+                            archive.writestr(f"{group}/{file}.gz", gzip.compress(f.read()))
+            for path in [tar_path, zip_path]:
+                neg, pos = pacfix.utils.get_input_valuations(path)
+                self.assertEqual(sorted(neg), sorted(expected[0]))
+                self.assertEqual(sorted(pos), sorted(expected[1]))
+        with tempfile.TemporaryDirectory() as tmp:
+            # Two runs in one archive: only the first root is read
+            zip_path = os.path.join(tmp, "runs.zip")
+            with zipfile.ZipFile(zip_path, "w") as archive:
+                archive.writestr("a/neg/1.txt", "neg-a")
+                archive.writestr("a/pos/1.txt", "pos-a")
+                archive.writestr("b/neg/1.txt", "neg-b")
+                archive.writestr("a/neg/nested/1.txt", "nested")
+            with self.assertLogs("pacfix-python-logger", "WARNING") as logs:
+                neg, pos = pacfix.utils.get_input_valuations(zip_path)
+            self.assertEqual((neg, pos), (["neg-a"], ["pos-a"]))
+            self.assertIn("ignored 2 files outside a/neg and a/pos", logs.output[0])
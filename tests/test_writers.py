@@ -0,0 +1,34 @@
+import unittest
+import io
+import json
+import pacfix
+from pacfix.writers import NdjsonWriter
+from .helpers import load_example01
+
+
+class TestWriters(unittest.TestCase):
+    def test_ndjson(self):
+        live_vars, vals_neg, vals_pos = load_example01()
+        output = io.StringIO()
+        writer = NdjsonWriter(output, live_vars, 0.01, inline_smt=True)
+        streamed = list()
+
+        def on_invariant(inv):
+            writer.write_invariant(inv)
+            # Records are written before learn returns
+            streamed.append(output.getvalue().count("\n"))
+
+        result = pacfix.learn(live_vars, vals_neg, vals_pos, 0.01, 1, writer.write_metadata, on_invariant)
+        writer.write_result(result)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([r["type"] for r in records], ["metadata", "invariant", "final"])
+        self.assertEqual(streamed, [2])
+        self.assertEqual(records[0]["hypothesis_space"]["original"], result.size_orig)
+        inv = records[1]
+        self.assertEqual(inv["expr"], "(c != 0)")
+        self.assertEqual(inv["variables"], ["c"])
+        self.assertEqual(inv["family"], "zero_non_zero")
+        self.assertEqual(inv["ast"]["type"], "NE")
+        self.assertEqual(inv["smt"], "(not (= c 0))")
+        self.assertEqual(records[2]["hypothesis_space"]["final"], 1)
+        self.assertEqual(records[2]["validation_time"], result.validation_time)